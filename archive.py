@@ -0,0 +1,189 @@
+import os
+import time
+import zlib
+import shutil
+import zipfile
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+# Estensioni di file già compressi, salvati nell'archivio senza ricomprimerli
+COMPRESSED_EXTENSIONS = ('.zip', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.7z', '.png', '.jpg', '.jpeg', '.gif', '.pdf')
+# Cartelle escluse per default: i log di input non cambiano tra un'esecuzione e l'altra,
+# work contiene i file intermedi delle esecuzioni non completate, i cui report sono copiati in failed
+DEFAULT_EXCLUDE = ('process_log', 'work')
+
+def list_files(folder_path, output_path, exclude=DEFAULT_EXCLUDE):
+    """
+    File da archiviare, con il nome relativo a folder_path: sono esclusi l'archivio stesso,
+    i suoi file temporanei e le cartelle di primo livello in exclude.
+    """
+    output = os.path.abspath(output_path)
+    files = []
+    for root, dirs, names in os.walk(folder_path):
+        if os.path.abspath(root) == os.path.abspath(folder_path):
+            dirs[:] = [name for name in dirs if name not in exclude]
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            if os.path.abspath(path) == output or name.startswith(os.path.basename(output_path) + '.tmp'):
+                continue
+            files.append((path, os.path.relpath(path, folder_path)))
+    return files
+
+def split_parts(files, parts):
+    """
+    Divide i file in parts gruppi in base al nome: lo stesso file finisce sempre nella stessa parte,
+    così le parti di archiviazioni successive della stessa cartella possono essere confrontate.
+    """
+    groups = [[] for _ in range(parts)]
+    for path, name in files:
+        groups[zlib.crc32(name.encode('utf-8')) % parts].append((path, name))
+    return groups
+
+def _write_file(archive, path, name):
+    # Restituisce True se il file è stato salvato senza compressione
+    if name.lower().endswith(COMPRESSED_EXTENSIONS):
+        archive.write(path, name, zipfile.ZIP_STORED)
+        return True
+    archive.write(path, name)
+    return False
+
+def _dos_time(date_time):
+    # il formato zip salva i secondi divisi per due
+    return date_time[:5] + (date_time[5] // 2 * 2,)
+
+def _changes(part_path, files):
+    """
+    Confronta i file con le voci dell'archivio precedente della parte (dimensione e data di modifica).
+
+    :return: Lista dei file nuovi da aggiungere, o None se l'archivio va ricreato perché manca, non è valido
+             o contiene file modificati o rimossi, che zipfile non permette di sostituire.
+    """
+    try:
+        with zipfile.ZipFile(part_path) as archive:
+            previous = dict((info.filename, info) for info in archive.infolist())
+    except (OSError, zipfile.BadZipFile):
+        return None
+    if set(previous) - set(name for _, name in files):
+        return None
+    added = []
+    for path, name in files:
+        info = previous.get(name)
+        if info is None:
+            added.append((path, name))
+            continue
+        current = zipfile.ZipInfo.from_file(path, name)
+        if current.file_size != info.file_size or _dos_time(current.date_time) != info.date_time:
+            return None
+    return added
+
+def update_part(part_path, files, level=6):
+    """
+    Aggiorna l'archivio di una parte: se i file già presenti non sono cambiati vengono aggiunti in coda
+    (ZipFile in modalità 'a') solo i file nuovi, altrimenti l'archivio viene ricreato in un file temporaneo.
+
+    :return: Dizionario con l'operazione ('reused', 'appended' o 'rebuilt'), i file scritti e quelli salvati
+             senza compressione.
+    """
+    added = _changes(part_path, files)
+    if added == []:
+        return {'mode': 'reused', 'written': 0, 'stored': 0}
+    stored = 0
+    if added is not None:
+        with zipfile.ZipFile(part_path, 'a', zipfile.ZIP_DEFLATED, allowZip64=True, compresslevel=level) as archive:
+            for path, name in added:
+                stored += _write_file(archive, path, name)
+        return {'mode': 'appended', 'written': len(added), 'stored': stored}
+    temporary = part_path + '.tmp%d' % os.getpid()
+    try:
+        with zipfile.ZipFile(temporary, 'w', zipfile.ZIP_DEFLATED, allowZip64=True, compresslevel=level) as archive:
+            for path, name in files:
+                stored += _write_file(archive, path, name)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    os.replace(temporary, part_path)
+    return {'mode': 'rebuilt', 'written': len(files), 'stored': stored}
+
+def build_archive(folder_path, output_path, exclude=DEFAULT_EXCLUDE, level=6, jobs=None, parts_dir=None):
+    """
+    Crea un archivio zip della cartella, senza i log di input né l'archivio stesso.
+    I file vengono divisi in parti compresse in parallelo da un pool di processi, ognuna in un proprio
+    archivio; l'archivio finale contiene gli archivi delle parti, salvati senza ricomprimerli.
+    Con parts_dir gli archivi delle parti restano in quella directory, da tenere fuori dalla cartella
+    archiviata: alla volta successiva a ogni parte vengono aggiunti solo i file nuovi, e viene ricreata
+    solo se uno dei suoi file è stato modificato o rimosso.
+    L'archivio finale viene scritto in un file temporaneo e rinominato solo quando è completo.
+
+    :param folder_path: Cartella da archiviare.
+    :param output_path: Archivio da creare.
+    :param exclude: Cartelle di primo livello da escludere.
+    :param level: Livello di compressione deflate.
+    :param jobs: Numero di parti e di processi, di default il numero di CPU.
+    :param parts_dir: Directory degli archivi delle parti da riusare, None per non conservarli.
+    :return: Dizionario con il numero di file, quelli salvati senza compressione, quelli compressi in questa
+             esecuzione, le parti riusate, estese e ricreate e la dimensione dell'archivio.
+    """
+    if not os.path.exists(folder_path):
+        raise FileNotFoundError(f"La cartella {folder_path} non esiste.")
+    started = time.time()
+    jobs = max(1, jobs or os.cpu_count() or 1)
+    files = list_files(folder_path, output_path, exclude)
+    keep_parts = parts_dir is not None
+    if keep_parts:
+        if not os.path.exists(parts_dir):
+            os.makedirs(parts_dir)
+    else:
+        parts_dir = tempfile.mkdtemp(prefix='archive_parts_', dir=os.path.dirname(os.path.abspath(output_path)))
+    stats = {'files': len(files), 'stored': 0, 'written': 0, 'reused': 0, 'appended': 0, 'rebuilt': 0}
+    temporary = output_path + '.tmp%d' % os.getpid()
+    try:
+        parts = [(os.path.join(parts_dir, 'part_%d_of_%d.zip' % (i + 1, jobs)), group)
+                 for i, group in enumerate(split_parts(files, jobs)) if group]
+        if jobs > 1 and len(parts) > 1:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(parts))) as executor:
+                results = list(executor.map(update_part, [path for path, _ in parts], [group for _, group in parts],
+                                            [level] * len(parts)))
+        else:
+            results = [update_part(path, group, level) for path, group in parts]
+        for result in results:
+            stats[result['mode']] += 1
+            stats['written'] += result['written']
+            stats['stored'] += result['stored']
+        with zipfile.ZipFile(temporary, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for path, _ in parts:
+                archive.write(path, os.path.basename(path))
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    finally:
+        if not keep_parts:
+            shutil.rmtree(parts_dir, ignore_errors=True)
+    if keep_parts:
+        # le parti di una divisione precedente con un altro numero di processi non servono più
+        current = set(os.path.basename(path) for path, _ in parts)
+        for name in os.listdir(parts_dir):
+            if name.startswith('part_') and name.endswith('.zip') and name not in current:
+                os.remove(os.path.join(parts_dir, name))
+    os.replace(temporary, output_path)
+    stats['size'] = os.path.getsize(output_path)
+    stats['seconds'] = time.time() - started
+    return stats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Archivia una cartella escludendo i log di input.')
+    parser.add_argument('folder', help='cartella da archiviare')
+    parser.add_argument('-o', help='archivio zip da creare', required=True)
+    parser.add_argument('--exclude', nargs='*', default=list(DEFAULT_EXCLUDE), help='cartelle di primo livello da escludere')
+    parser.add_argument('--jobs', type=int, default=None, help='parti compresse in parallelo, di default il numero di CPU')
+    parser.add_argument('--parts-dir', type=str, default=None,
+                        help='directory, fuori dalla cartella archiviata, in cui conservare le parti per aggiornarle la volta successiva')
+    args = parser.parse_args()
+
+    stats = build_archive(args.folder, args.o, args.exclude, jobs=args.jobs, parts_dir=args.parts_dir)
+    print(f"{stats['files']} file, {stats['stored']} senza compressione, {stats['written']} compressi ora; "
+          f"parti riusate {stats['reused']}, estese {stats['appended']}, ricreate {stats['rebuilt']}; "
+          f"{stats['size']} byte in {stats['seconds']:.1f} secondi")
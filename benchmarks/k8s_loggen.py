@@ -0,0 +1,110 @@
+import os
+import re
+import sys
+import gzip
+import random
+import string
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import k8s_preprocess
+
+# Header klog di cui si conservano severità, thread id e sorgente (file.go:riga)
+KLOG_FIELDS = re.compile(r'([IWEF])\d{4} \d{2}:\d{2}:\d{2}\.\d+(\s+)(\d+) ([^\s\]]+\]) ?')
+# Campi variabili dei messaggi: UUID, indirizzi IP, valori esadecimali, hash di ReplicaSet e pod, numeri
+VARIABLE = re.compile(r'(?P<date>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d+)'
+                      r'|(?P<uuid>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})'
+                      r'|(?P<ip>\b\d{1,3}\.\d{1,3})\.\d{1,3}\.\d{1,3}\b'
+                      r'|(?<=0x)(?P<hex>[0-9a-f]+)'
+                      r'|(?<=-)(?P<hash>(?=[a-f]*\d)[0-9a-f]{8,10}|(?=[a-z]*\d)[a-z0-9]{5})\b'
+                      r'|(?<![A-Za-z0-9.])(?P<number>\d+)')
+HEX_LETTERS = 'abcdef'
+
+class Template(object):
+    """ Una riga del campione: prefisso CRI, header klog (se presente) e messaggio """
+
+    def __init__(self, line):
+        parts = line.split(' ', 3)
+        if len(parts) >= 3 and parts[1] in k8s_preprocess.CRI_STREAMS and parts[2] in k8s_preprocess.CRI_TAGS:
+            self.stream, self.tag = parts[1], parts[2]
+            message = parts[3] if len(parts) == 4 else ''
+        else:
+            self.stream, self.tag = 'stderr', 'F'
+            message = line
+        klog = KLOG_FIELDS.match(message)
+        self.klog = klog.groups() if klog else None
+        message = message[klog.end():] if klog else message
+        # Il messaggio viene diviso una volta sola in parti fisse e campi variabili
+        self.pieces = []
+        position = 0
+        for match in VARIABLE.finditer(message):
+            self.pieces.append(message[position:match.start()])
+            self.pieces.append((match.lastgroup, match.group(), match.group('ip')))
+            position = match.end()
+        self.pieces.append(message[position:])
+
+class K8sLogGenerator(object):
+    """
+    Genera log CRI/klog realistici a partire da un log di esempio: ogni riga generata riprende
+    un template del campione (stesso sorgente klog e stessa struttura key=value) con timestamp
+    crescenti e nuovi valori per UUID, IP, hash dei pod e numeri.
+
+    :param sample_path: Log CRI di esempio, ad esempio logs/process_log/K8s_scheduler.log.
+    :param seed: Seed del generatore.
+    :param lines_per_second: Frequenza media delle righe generate.
+    """
+
+    def __init__(self, sample_path, seed=0, lines_per_second=200.0):
+        with open(sample_path, 'r', encoding='utf-8', errors='replace') as file:
+            self.templates = [Template(line.rstrip('\r\n')) for line in file if line.strip()]
+        self.rng = random.Random(seed)
+        self.interval = 1.0 / lines_per_second
+        self.clock = datetime.datetime(2023, 9, 3, 4, 46, 46, tzinfo=datetime.timezone.utc)
+
+    def _value(self, field):
+        rng = self.rng
+        kind, token, ip_prefix = field
+        if kind == 'date':
+            return self.clock.strftime('%Y-%m-%d %H:%M:%S.%f')
+        if kind == 'ip':
+            return '%s.%d.%d' % (ip_prefix, rng.randint(0, 255), rng.randint(1, 254))
+        if kind == 'number':
+            if len(token) == 1:
+                return token
+            return str(rng.randint(1, 9)) + ''.join(rng.choice(string.digits) for _ in token[1:])
+        letters = HEX_LETTERS if kind in ('uuid', 'hex') or all(c in string.hexdigits for c in token) else string.ascii_lowercase
+        return ''.join(c if c == '-' else rng.choice(string.digits) if c.isdigit() else rng.choice(letters)
+                       for c in token)
+
+    def line(self):
+        """ Genera la riga successiva """
+        template = self.rng.choice(self.templates)
+        self.clock += datetime.timedelta(seconds=self.rng.expovariate(1.0 / self.interval))
+        local = self.clock.astimezone(datetime.timezone(datetime.timedelta(hours=2)))
+        timestamp = local.strftime('%Y-%m-%dT%H:%M:%S.') + '%09d' % (local.microsecond * 1000 + self.rng.randint(0, 999)) + '+02:00'
+        message = ''.join(piece if isinstance(piece, str) else self._value(piece) for piece in template.pieces)
+        if template.klog:
+            severity, spaces, thread, source = template.klog
+            header = '%s%s %s%s%s %s ' % (severity, self.clock.strftime('%m%d'), self.clock.strftime('%H:%M:%S.%f'),
+                                          spaces, thread, source)
+            message = header + message
+        return '%s %s %s %s' % (timestamp, template.stream, template.tag, message)
+
+    def write(self, output_path, lines, batch_size=10000):
+        """ Scrive lines righe in output_path, compresso con gzip se termina con .gz """
+        opener = gzip.open if output_path.endswith('.gz') else open
+        with opener(output_path, 'wt', encoding='utf-8') as file:
+            for start in range(0, lines, batch_size):
+                count = min(batch_size, lines - start)
+                file.write(''.join(self.line() + '\n' for _ in range(count)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Genera log Kubernetes sintetici a partire da un log di esempio.')
+    parser.add_argument('--sample', type=str, default='logs/process_log/K8s_scheduler.log', help='Log CRI di esempio.')
+    parser.add_argument('--lines', type=int, default=10000, help='Numero di righe da generare.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed del generatore.')
+    parser.add_argument('-o', type=str, required=True, help='File di output, compresso se termina con .gz.')
+    args = parser.parse_args()
+
+    K8sLogGenerator(args.sample, args.seed).write(args.o, args.lines)
@@ -0,0 +1,276 @@
+import os
+import sys
+import json
+import time
+import queue
+import logging
+import traceback
+import argparse
+import importlib.util
+import platform
+import resource
+import multiprocessing
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import k8s_preprocess
+from k8s_loggen import K8sLogGenerator
+
+# Configurazione del logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+DEFAULT_SIZES = '10000,100000,1000000,10000000'
+
+# Moduli usati dalle fasi, importati da _load nel processo che misura la fase prima di avviare il cronometro:
+# l'import di plot_cdf (matplotlib) da solo dura più della fusione dei punteggi
+pipeline = None
+evaluation = None
+plot_cdf = None
+stage_runner = None
+vector_store = None
+
+def _load(*names):
+    for name in names:
+        globals()[name] = importlib.import_module(name)
+
+def prepare_log(sample, lines, data_dir, seed):
+    """ Genera (una sola volta) il log sintetico e la sua versione senza prefissi CRI/klog """
+    name = '%s_%d_%d' % (os.path.splitext(os.path.basename(sample))[0], lines, seed)
+    raw_log = os.path.join(data_dir, name + '.log')
+    processed_log = os.path.join(data_dir, name + '.processed.log')
+    if not os.path.isfile(raw_log):
+        logging.info(f"Generazione di {raw_log}")
+        K8sLogGenerator(sample, seed).write(raw_log + '.tmp', lines)
+        os.rename(raw_log + '.tmp', raw_log)
+    if not os.path.isfile(processed_log):
+        with open(processed_log, 'w', encoding='utf-8') as output:
+            for message in k8s_preprocess.iter_messages(raw_log):
+                output.write(message + '\n')
+    return raw_log, processed_log
+
+def _write_vectors(path, words, rng, dimension=32):
+    words = list(words)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('%d %d\n' % (len(words), dimension))
+        for start in range(0, len(words), 10000):
+            block = rng.standard_normal((len(words[start:start + 10000]), dimension)).astype(np.float32)
+            file.write(''.join(word + ' ' + ' '.join('%.6f' % value for value in row) + '\n'
+                               for word, row in zip(words[start:start + 10000], block)))
+
+def prepare_evaluation(processed_log, workdir, seed):
+    """
+    Prepara per evaluate() un modello delle parole e dei vettori OOV con valori casuali, già convertiti
+    nel formato binario di vector_store come fa la fase vector_store della pipeline prima di evaluate.
+    """
+    _load('pipeline', 'vector_store')
+    word_model = os.path.join(workdir, 'embedding.model')
+    oov_vector = os.path.join(workdir, 'oov.vector')
+    old_to_new_dict = os.path.join(workdir, 'changed_log', 'old_new_dict.txt')
+    if not os.path.isfile(oov_vector):
+        _write_evaluation_data(processed_log, workdir, seed, word_model, oov_vector)
+    for path in (word_model, oov_vector):
+        if not vector_store.is_fresh(path):
+            vector_store.convert(path)
+    return word_model, old_to_new_dict, oov_vector
+
+def _write_evaluation_data(processed_log, workdir, seed, word_model, oov_vector):
+    new_vocab, old_to_new_dict = pipeline.generate_oov(processed_log, workdir, seed)
+    vocabulary = {}
+    with open(processed_log, 'r', encoding='utf-8') as file:
+        for line in file:
+            for word in line.split():
+                vocabulary[word] = None
+    rng = np.random.default_rng(seed)
+    _write_vectors(word_model, vocabulary, rng)
+    with open(new_vocab, 'r', encoding='utf-8') as file:
+        _write_vectors(oov_vector, (word.strip() for word in file if word.strip()), rng)
+
+def prepare_scores(workdir, files, seed):
+    """ Crea un albero di risultati con files file 'score' per merge_scores() """
+    source_dir = os.path.join(workdir, 'results')
+    if os.path.isdir(source_dir):
+        return source_dir
+    rng = np.random.default_rng(seed)
+    for i, value in enumerate(rng.random(files)):
+        score_dir = os.path.join(source_dir, 'run_%d' % i, 'score')
+        os.makedirs(score_dir)
+        with open(os.path.join(score_dir, 'score'), 'w') as file:
+            file.write('score: %f\n' % value)
+    return source_dir
+
+def bench_strip_prefix(raw_log, processed_log, workdir):
+    chunks = k8s_preprocess.split_log(raw_log, os.path.join(workdir, 'chunks'), os.cpu_count() or 1)
+    return sum(1 for chunk in chunks for _ in open(chunk, 'rb'))
+
+def setup_preprocess_log():
+    # come il worker della pipeline, librerie e modelli sono già caricati quando la fase parte
+    _load('pipeline', 'stage_runner')
+    stage_runner.preload(stage_runner.DEFAULT_PRELOAD, stage_runner.DEFAULT_SPACY_MODELS, stage_runner.DEFAULT_NLTK_CORPORA)
+
+def bench_preprocess_log(raw_log, processed_log, workdir):
+    with stage_runner.StageRunner('inline') as runner:
+        pipeline.preprocess_log(raw_log, workdir, runner, os.cpu_count() or 1)
+    return sum(1 for _ in open(raw_log, 'rb'))
+
+def bench_generate_oov(raw_log, processed_log, workdir):
+    pipeline.generate_oov(processed_log, os.path.join(workdir, 'oov'), 0)
+    return sum(1 for _ in open(processed_log, 'rb'))
+
+def bench_evaluate(raw_log, processed_log, workdir, word_model, old_to_new_dict, oov_vector):
+    score, result = evaluation.evaluate(word_model, old_to_new_dict, oov_vector, workdir)
+    return len(result)
+
+def bench_merge_scores(raw_log, processed_log, workdir, source_dir):
+    plot_cdf.merge_scores(source_dir, os.path.join(workdir, 'all_scores.txt'))
+    return sum(1 for _ in open(os.path.join(workdir, 'all_scores.txt')))
+
+# Fasi misurate: funzione, unità di misura degli elementi elaborati e preparazione non cronometrata
+BENCHMARKS = {
+    'strip_prefix': (bench_strip_prefix, 'lines', None),
+    'preprocess_log': (bench_preprocess_log, 'lines', setup_preprocess_log),
+    'generate_oov': (bench_generate_oov, 'lines', lambda: _load('pipeline')),
+    'evaluate': (bench_evaluate, 'pairs', lambda: _load('evaluation')),
+    'merge_scores': (bench_merge_scores, 'files', lambda: _load('plot_cdf')),
+}
+
+def _measure(stage, args, results):
+    try:
+        function, unit, setup = BENCHMARKS[stage]
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        items = function(*args)
+        seconds = time.perf_counter() - start
+    except BaseException:
+        # l'errore viene rimandato al padre, che altrimenti resterebbe in attesa di un risultato
+        results.put(('error', traceback.format_exc()))
+        return
+    results.put(('ok', (items, seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)))
+
+def measure(stage, args):
+    """
+    Esegue la fase stage in un nuovo interprete, così che il picco di memoria sia solo quello della fase;
+    la sua preparazione (import dei moduli, caricamento dei modelli) avviene prima di avviare il cronometro.
+
+    :return: Tuple (elementi elaborati, secondi, picco di memoria in KB).
+    :raises RuntimeError: Se la fase solleva un'eccezione o il processo termina senza risultato.
+    """
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=_measure, args=(stage, args, results))
+    process.start()
+    try:
+        while True:
+            try:
+                status, result = results.get(timeout=1)
+                break
+            except queue.Empty:
+                # il processo può essere morto senza scrivere nulla, ad esempio per un segnale
+                if not process.is_alive() and results.empty():
+                    raise RuntimeError('%s terminato con codice %s senza risultato' % (stage, process.exitcode))
+    finally:
+        process.join()
+    if status == 'error':
+        raise RuntimeError('%s non riuscito:\n%s' % (stage, result))
+    return result
+
+def compare(results, baseline, threshold):
+    """
+    Confronta i risultati con quelli di riferimento e restituisce le regressioni trovate:
+    throughput più basso o memoria più alta di oltre threshold rispetto al riferimento.
+    """
+    reference = dict(((row['stage'], row['lines']), row) for row in baseline['results'])
+    regressions = []
+    for row in results:
+        base = reference.get((row['stage'], row['lines']))
+        if base is None:
+            continue
+        if row['throughput'] < base['throughput'] * (1 - threshold):
+            regressions.append('%s @ %d righe: throughput %.0f -> %.0f %s/s' % (
+                row['stage'], row['lines'], base['throughput'], row['throughput'], row['unit']))
+        if row['maxrss_kb'] > base['maxrss_kb'] * (1 + threshold):
+            regressions.append('%s @ %d righe: memoria %.1f -> %.1f MB' % (
+                row['stage'], row['lines'], base['maxrss_kb'] / 1024.0, row['maxrss_kb'] / 1024.0))
+    return regressions
+
+def main(args):
+    sizes = [int(size) for size in args.sizes.split(',')]
+    stages = args.stages.split(',') if args.stages else list(BENCHMARKS)
+    if 'preprocess_log' in stages and not os.path.isfile(os.path.join('code', 'preprocessing.py')):
+        logging.warning("code/preprocessing.py non trovato: preprocess_log viene saltato")
+        stages.remove('preprocess_log')
+    if 'merge_scores' in stages and importlib.util.find_spec('matplotlib') is None:
+        logging.warning("matplotlib non installato: merge_scores viene saltato")
+        stages.remove('merge_scores')
+
+    results = []
+    failed = 0
+    for lines in sizes:
+        workdir = os.path.join(args.data_dir, 'work_%d' % lines)
+        if not os.path.exists(workdir):
+            os.makedirs(workdir)
+        raw_log, processed_log = prepare_log(args.sample, lines, args.data_dir, args.seed)
+        for stage in stages:
+            unit = BENCHMARKS[stage][1]
+            extra = ()
+            if stage == 'evaluate':
+                extra = prepare_evaluation(processed_log, workdir, args.seed)
+            elif stage == 'merge_scores':
+                extra = (prepare_scores(workdir, max(1, lines // 1000), args.seed),)
+            try:
+                items, seconds, maxrss = measure(stage, (raw_log, processed_log, workdir) + extra)
+            except RuntimeError as e:
+                logging.error(f"{stage} @ {lines} righe: {e}")
+                failed += 1
+                continue
+            row = {'stage': stage, 'lines': lines, 'items': items, 'unit': unit, 'seconds': seconds,
+                   'throughput': items / seconds if seconds > 0 else float('inf'), 'maxrss_kb': maxrss}
+            logging.info('%-15s %10d righe  %10.2f s  %12.0f %s/s  %8.1f MB' % (
+                stage, lines, seconds, row['throughput'], unit, maxrss / 1024.0))
+            results.append(row)
+
+    report = {
+        'meta': {
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'sample': args.sample,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    output = args.output or os.path.join(args.results_dir, time.strftime('%Y%m%d_%H%M%S') + '.json')
+    if not os.path.exists(os.path.dirname(os.path.abspath(output))):
+        os.makedirs(os.path.dirname(os.path.abspath(output)))
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=1)
+    logging.info(f"Risultati salvati in {output}")
+    if failed:
+        logging.error(f"{failed} misure non riuscite")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            logging.error(f"Regressione: {regression}")
+        if regressions:
+            return 1
+        logging.info("Nessuna regressione rispetto al riferimento.")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Misura throughput e memoria delle fasi Python al crescere del log.')
+    parser.add_argument('--sample', type=str, default='logs/process_log/K8s_scheduler.log', help='Log CRI di esempio.')
+    parser.add_argument('--sizes', type=str, default=DEFAULT_SIZES, help='Numero di righe dei log generati, separati da virgole.')
+    parser.add_argument('--stages', type=str, default=None, help='Fasi da misurare, separate da virgole (default: tutte).')
+    parser.add_argument('--seed', type=int, default=0, help='Seed dei dati generati.')
+    parser.add_argument('--data-dir', type=str, default='benchmarks/data', help='Directory dei log generati.')
+    parser.add_argument('--results-dir', type=str, default='benchmarks/results', help='Directory dei risultati.')
+    parser.add_argument('--output', type=str, default=None, help='File JSON dei risultati.')
+    parser.add_argument('--baseline', type=str, default=None, help='Risultati di riferimento con cui confrontarsi.')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Variazione relativa considerata regressione.')
+    args = parser.parse_args()
+
+    sys.exit(main(args))
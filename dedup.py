@@ -0,0 +1,59 @@
+import array
+import argparse
+import numpy as np
+
+def dedup_log(processed_log, unique_log, index_file):
+    """
+    Riduce il log preprocessato alle sole righe distinte, nell'ordine di prima occorrenza.
+
+    :param processed_log: Log senza variabili, una riga per messaggio.
+    :param unique_log: File in cui scrivere le righe distinte.
+    :param index_file: File .npy con, per ogni riga del log, la posizione della riga distinta corrispondente.
+    :return: Tuple (righe del log, righe distinte).
+    """
+    unique = {}
+    # array di int32 invece di una lista, per non tenere in memoria un oggetto per riga
+    index = array.array('i')
+    with open(processed_log, 'r', encoding='utf-8') as file:
+        for line in file:
+            index.append(unique.setdefault(line, len(unique)))
+    with open(unique_log, 'w', encoding='utf-8') as file:
+        file.writelines(unique)
+    np.save(index_file, np.frombuffer(index, dtype=np.int32))
+    return len(index), len(unique)
+
+def _has_header(first_line, rows, unique_rows):
+    # Header in formato word2vec ("righe dimensione") presente se il file ha una riga in più
+    parts = first_line.split()
+    return rows == unique_rows + 1 and len(parts) == 2 and all(part.isdigit() for part in parts)
+
+def expand_vectors(unique_vector, index_file, output_vector):
+    """
+    Riporta i vettori calcolati sulle righe distinte su tutte le righe del log originale,
+    ripetendo per ogni riga il vettore della riga distinta corrispondente.
+
+    :param unique_vector: Vettori delle righe distinte, uno per riga, con eventuale header word2vec.
+    :param index_file: Indice scritto da dedup_log.
+    :param output_vector: File dei vettori di tutte le righe, nello stesso formato di unique_vector.
+    """
+    index = np.load(index_file, mmap_mode='r')
+    with open(unique_vector, 'r', encoding='utf-8') as file:
+        rows = file.readlines()
+    unique_rows = int(index.max()) + 1 if len(index) else 0
+    with open(output_vector, 'w', encoding='utf-8') as file:
+        if rows and _has_header(rows[0], len(rows), unique_rows):
+            file.write('%d %s\n' % (len(index), rows[0].split()[1]))
+            rows = rows[1:]
+        if len(rows) != unique_rows:
+            raise ValueError('%s has %d vectors, expected %d' % (unique_vector, len(rows), unique_rows))
+        for start in range(0, len(index), 100000):
+            file.writelines(rows[position] for position in index[start:start + 100000])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Deduplica le righe di un log preprocessato.')
+    parser.add_argument('-logs', help='processed log', required=True)
+    parser.add_argument('-o', help='output file with the distinct lines', required=True)
+    args = parser.parse_args()
+
+    lines, unique = dedup_log(args.logs, args.o, args.o + '.index.npy')
+    print(f'{lines} lines, {unique} distinct', flush=True)
@@ -2,6 +2,7 @@ import argparse
 import smtplib
 import zipfile
 import os
+import archive
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
@@ -51,23 +52,17 @@ def zip_folder(folder_path, output_path):
         print(f"Errore durante la creazione del file zip: {e}")
         raise
     
-def zip_folder_all(folder_path, output_path):
-    """ Zippa l'intera cartella inclusi tutti i file e sottocartelle """
-    
-    # Verifica che la cartella esista
-    if not os.path.exists(folder_path):
-        raise FileNotFoundError(f"La cartella {folder_path} non esiste.")
-    
+def zip_folder_all(folder_path, output_path, parts_dir=None):
+    """
+    Zippa l'intera cartella tranne i log di input (process_log), i file intermedi (work) e l'archivio stesso;
+    con parts_dir le parti dell'archivio vengono conservate lì e aggiornate solo con i file cambiati.
+    """
+
     try:
-        # Crea un file zip
-        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # Cammina attraverso la cartella e aggiungi file e sottocartelle
-            for root, dirs, files in os.walk(folder_path):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    # Aggiungi i file all'archivio zip mantenendo la struttura della cartella
-                    zipf.write(file_path, os.path.relpath(file_path, folder_path))
-    
+        stats = archive.build_archive(folder_path, output_path, archive.DEFAULT_EXCLUDE, parts_dir=parts_dir)
+        print(f"Archivio {output_path}: {stats['files']} file, {stats['stored']} senza compressione, "
+              f"{stats['written']} compressi ora, {stats['size']} byte in {stats['seconds']:.1f} secondi")
+
     except Exception as e:
         print(f"Errore durante la creazione del file zip: {e}")
         raise
@@ -119,6 +114,7 @@ if __name__ == "__main__":
     parser.add_argument('-n', help='Numero di iterazioni', type=int)  # Numero di iterazioni (obbligatorio se -t è specificato)
     parser.add_argument('-e', help='Invia notifica di errore', action='store_true')  # Flag per inviare notifica di errore
     parser.add_argument('-f', help='Percorso della cartella da zippare', default='./logs')  # Nuovo argomento per il percorso della cartella
+    parser.add_argument('-c', help="Directory fuori dalla cartella da zippare in cui conservare le parti dell'archivio", default=None)
     args = parser.parse_args()
 
     # Dettagli email
@@ -136,7 +132,7 @@ if __name__ == "__main__":
         ensure_dir_exists(os.path.dirname(zip_file_path))
         
         # Zippa la cartella
-        zip_folder_all(folder_to_zip, zip_file_path)
+        zip_folder_all(folder_to_zip, zip_file_path, args.c)
         
         if args.e:
             # Dettagli email in caso di errore
@@ -0,0 +1,104 @@
+import os
+import pickle
+import argparse
+import numpy as np
+import vector_store
+
+class NoPairsError(ValueError):
+    """ Nessuna coppia (parola, parola OOV) ha i vettori di entrambe le parole: l'iterazione non ha un punteggio """
+    pass
+
+def load_vectors(path, words):
+    """
+    Estrae le righe delle parole richieste da un file di vettori in formato word2vec testuale,
+    leggendole dalla sua versione binaria (creata al primo accesso).
+
+    :param path: Percorso del file dei vettori.
+    :param words: Insieme delle parole da caricare.
+    :return: Tuple (dizionario parola -> indice di riga, matrice float32 dei vettori).
+    """
+    return vector_store.open_vectors(path).lookup(words)
+
+def normalize(matrix):
+    """ Normalizza le righe della matrice a norma unitaria """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+def score_pairs(old_new_dict, word_index, word_matrix, oov_index, oov_matrix):
+    """
+    Calcola in un solo passaggio la similarità coseno di tutte le coppie (parola, parola OOV).
+
+    :param old_new_dict: Dizionario parola originale -> lista delle parole modificate.
+    :param word_index: Indice di riga delle parole originali in word_matrix.
+    :param word_matrix: Vettori delle parole originali.
+    :param oov_index: Indice di riga delle parole OOV in oov_matrix.
+    :param oov_matrix: Vettori delle parole OOV.
+    :return: Lista di tuple (parola, parola OOV, punteggio).
+    """
+    pairs = []
+    for key in old_new_dict:
+        if key not in word_index:
+            print(key)
+            continue
+        for new_word in old_new_dict[key]:
+            if new_word not in oov_index:
+                print(new_word)
+                continue
+            pairs.append((key, new_word))
+    if not pairs:
+        return []
+    old_rows = np.fromiter((word_index[old] for old, _ in pairs), dtype=np.int64, count=len(pairs))
+    new_rows = np.fromiter((oov_index[new] for _, new in pairs), dtype=np.int64, count=len(pairs))
+    old_vectors = normalize(word_matrix[old_rows].astype(np.float64))
+    new_vectors = normalize(oov_matrix[new_rows].astype(np.float64))
+    scores = np.einsum('ij,ij->i', old_vectors, new_vectors)
+    return [(old, new, float(score)) for (old, new), score in zip(pairs, scores)]
+
+def evaluate(word_model_path, old_to_new_dict, oov_vector_path, opath, store=None, run_id=None, iteration=None):
+    """
+    Valuta i vettori OOV confrontandoli con i vettori delle parole originali e salva
+    il punteggio medio in score/score e i punteggi delle singole coppie in score/result.txt.
+
+    :param word_model_path: Modello delle parole in formato word2vec testuale.
+    :param old_to_new_dict: File pickle con il dizionario parola -> parole modificate.
+    :param oov_vector_path: Vettori OOV in formato word2vec testuale.
+    :param opath: Directory in cui creare la cartella score.
+    :param store: ResultsStore in cui salvare anche i punteggi, insieme a run_id e iteration.
+    :param run_id: Esecuzione registrata nello store.
+    :param iteration: Numero dell'iterazione, a partire da 1.
+    :return: Tuple (punteggio medio, lista di tuple (parola, parola OOV, punteggio)).
+    :raises NoPairsError: Se nessuna coppia può essere valutata.
+    """
+    with open(old_to_new_dict, 'rb') as file:
+        old_new_dict = pickle.loads(file.read())
+    new_words = set(word for words in old_new_dict.values() for word in words)
+    word_index, word_matrix = load_vectors(word_model_path, set(old_new_dict))
+    oov_index, oov_matrix = load_vectors(oov_vector_path, new_words)
+    result = score_pairs(old_new_dict, word_index, word_matrix, oov_index, oov_matrix)
+    if not result:
+        raise NoPairsError('Nessuna coppia di parole valutabile in %s' % old_to_new_dict)
+    score = sum(pair[2] for pair in result) / len(result)
+
+    score_path = os.path.join(opath, 'score')
+    if not os.path.exists(score_path):
+        os.mkdir(score_path)
+    with open(os.path.join(score_path, 'score'), 'w') as ofile:
+        ofile.write('score: '+str(score)+'\n')
+    with open(os.path.join(score_path, 'result.txt'), 'w') as ofile:
+        ofile.write(''.join('%s %s %s\n' % (old, new, str(value)) for old, new, value in result))
+    if store is not None:
+        store.record_iteration(run_id, iteration, score, result)
+
+    return score, result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Valuta i vettori OOV rispetto al modello delle parole.')
+    parser.add_argument('-word_model', help='word model in word2vec text format', required=True)
+    parser.add_argument('-old_new_dict', help='pickled old -> new words dictionary', required=True)
+    parser.add_argument('-oov_vector', help='OOV vectors in word2vec text format', required=True)
+    parser.add_argument('-o', help='output directory', required=True)
+    args = parser.parse_args()
+
+    score, result = evaluate(args.word_model, args.old_new_dict, args.oov_vector, args.o)
+    print(score, flush=True)
@@ -0,0 +1,121 @@
+import os
+import re
+import gzip
+import shutil
+import argparse
+import itertools
+import multiprocessing
+
+# Righe lette e ripulite da ogni processo in un colpo solo
+STRIP_BATCH_SIZE = 10000
+# Righe di ogni chunk passato a code/preprocessing.py
+CHUNK_LINES = 200000
+
+CRI_STREAMS = ('stdout', 'stderr')
+CRI_TAGS = ('F', 'P')
+# Header klog: severità, data, ora, thread id e sorgente, es. "I0903 04:46:46.780039       1 handler.go:143] "
+KLOG_HEADER = re.compile(r'[IWEF]\d{4} \d{2}:\d{2}:\d{2}\.\d+\s+\d+ [^\s\]]+\] ?')
+
+def open_log(path):
+    """ Apre un log in lettura binaria, decomprimendolo al volo se termina con .gz """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+def parse_line(line):
+    """
+    Rimuove da una riga il prefisso CRI (timestamp, stream, tag) e l'header klog.
+
+    :param line: Riga del log senza terminatore.
+    :return: Tuple (messaggio, parziale) dove parziale è True per le righe CRI con tag P.
+    """
+    parts = line.split(' ', 3)
+    partial = False
+    if len(parts) >= 3 and parts[1] in CRI_STREAMS and parts[2] in CRI_TAGS:
+        partial = parts[2] == 'P'
+        line = parts[3] if len(parts) == 4 else ''
+    header = KLOG_HEADER.match(line)
+    if header is not None:
+        line = line[header.end():]
+    return line, partial
+
+def strip_batch(lines):
+    """ Applica parse_line a un batch di righe binarie """
+    return [parse_line(line.decode('utf-8', 'replace').rstrip('\r\n')) for line in lines]
+
+def iter_batches(path, batch_size=STRIP_BATCH_SIZE):
+    with open_log(path) as file:
+        while True:
+            batch = list(itertools.islice(file, batch_size))
+            if not batch:
+                break
+            yield batch
+
+def iter_messages(path, jobs=1, strip_prefix=True):
+    """
+    Legge il log a batch e restituisce i messaggi nell'ordine originale, unendo le righe CRI parziali.
+    Con jobs > 1 i batch vengono ripuliti in parallelo da un pool di processi.
+
+    :param path: Log CRI, eventualmente compresso con gzip.
+    :param jobs: Numero di processi usati per ripulire le righe.
+    :param strip_prefix: Se False le righe vengono restituite senza modifiche.
+    """
+    if not strip_prefix:
+        for batch in iter_batches(path):
+            for line in batch:
+                yield line.decode('utf-8', 'replace').rstrip('\r\n')
+        return
+    pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+    try:
+        batches = pool.imap(strip_batch, iter_batches(path)) if pool else map(strip_batch, iter_batches(path))
+        pending = []
+        for batch in batches:
+            for message, partial in batch:
+                pending.append(message)
+                if not partial:
+                    yield ''.join(pending)
+                    pending = []
+        if pending:
+            yield ''.join(pending)
+    finally:
+        if pool:
+            pool.terminate()
+
+def split_log(path, chunk_dir, jobs=1, strip_prefix=True, chunk_lines=CHUNK_LINES):
+    """
+    Ripulisce il log e lo divide in chunk di chunk_lines righe, scritti in ordine in chunk_dir.
+
+    :return: Lista ordinata dei percorsi dei chunk.
+    """
+    if not os.path.exists(chunk_dir):
+        os.makedirs(chunk_dir)
+    chunks = []
+    output = None
+    for count, message in enumerate(iter_messages(path, jobs, strip_prefix)):
+        if count % chunk_lines == 0:
+            if output:
+                output.close()
+            chunks.append(os.path.join(chunk_dir, 'chunk_%05d.log' % len(chunks)))
+            output = open(chunks[-1], 'w', encoding='utf-8')
+        output.write(message + '\n')
+    if output:
+        output.close()
+    return chunks
+
+def concatenate(paths, output_path):
+    """ Concatena i file indicati, nell'ordine dato, in output_path """
+    with open(output_path, 'wb') as output:
+        for path in paths:
+            with open(path, 'rb') as file:
+                shutil.copyfileobj(file, output)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rimuove prefissi CRI e header klog da un log Kubernetes.')
+    parser.add_argument('-rawlog', help='CRI log, optionally gzip compressed', required=True)
+    parser.add_argument('-o', help='output file', required=True)
+    parser.add_argument('--jobs', help='number of processes', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with open(args.o, 'w', encoding='utf-8') as output:
+        for message in iter_messages(args.rawlog, args.jobs):
+            output.write(message + '\n')
@@ -0,0 +1,254 @@
+import os
+import json
+import argparse
+import tempfile
+import numpy as np
+import vector_store
+
+# Righe della matrice confrontate con le query in ogni blocco della ricerca esatta
+SEARCH_CHUNK_ROWS = 65536
+# Righe usate al massimo per addestrare il k-means della modalità approssimata
+KMEANS_SAMPLE = 100000
+KMEANS_ITERATIONS = 10
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+def _line_offsets(log_file):
+    # Posizione in byte dell'inizio di ogni riga, per leggere una riga senza scorrere il file
+    offsets = [0]
+    with open(log_file, 'rb') as file:
+        for line in file:
+            offsets.append(offsets[-1] + len(line))
+    return np.array(offsets[:-1], dtype=np.int64)
+
+def _top_k(scores, rows, k):
+    # Le k colonne con punteggio più alto di ogni riga di scores, in ordine decrescente
+    if scores.shape[1] > k:
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, best, axis=1)
+        rows = np.take_along_axis(rows, best, axis=1)
+    order = np.argsort(-scores, axis=1, kind='stable')
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+def _assign(vectors, centroids):
+    # Centroide più vicino di ogni vettore, a blocchi per limitare la memoria
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), SEARCH_CHUNK_ROWS):
+        block = np.asarray(vectors[start:start + SEARCH_CHUNK_ROWS])
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+def kmeans(vectors, clusters, seed=0, iterations=KMEANS_ITERATIONS):
+    """
+    K-means sferico (similarità coseno) su un campione dei vettori normalizzati.
+
+    :return: Matrice dei centroidi normalizzati.
+    """
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if len(vectors) > KMEANS_SAMPLE:
+        sample = vectors[np.sort(rng.choice(len(vectors), KMEANS_SAMPLE, replace=False))]
+    sample = np.asarray(sample)
+    centroids = sample[rng.choice(len(sample), clusters, replace=False)]
+    for _ in range(iterations):
+        labels = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        empty = ~sums.any(axis=1)
+        # i cluster rimasti vuoti ripartono da un vettore a caso
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids.astype(np.float32)
+
+def build_index(log_vector, log_file, index_dir, clusters=0, seed=0):
+    """
+    Costruisce su disco l'indice dei vettori di log_vector, una riga per riga di log_file.
+
+    :param log_vector: Vettori dei log, ad esempio log.vector scritto da Log2Vec.py.
+    :param log_file: Log corrispondente, riga per riga, usato per mostrare i risultati.
+    :param index_dir: Directory dell'indice.
+    :param clusters: Numero di partizioni per la ricerca approssimata, 0 per la sola ricerca esatta.
+    :param seed: Seed del k-means.
+    """
+    if not os.path.exists(index_dir):
+        os.makedirs(index_dir)
+    source = vector_store.open_vectors(log_vector).matrix
+    offsets = _line_offsets(log_file)
+    if len(offsets) != len(source):
+        raise ValueError('%s has %d vectors but %s has %d lines' % (log_vector, len(source), log_file, len(offsets)))
+    vectors = np.lib.format.open_memmap(os.path.join(index_dir, 'vectors.npy'), mode='w+',
+                                        dtype=np.float32, shape=source.shape)
+    for start in range(0, len(source), SEARCH_CHUNK_ROWS):
+        vectors[start:start + SEARCH_CHUNK_ROWS] = _normalize(np.asarray(source[start:start + SEARCH_CHUNK_ROWS]))
+    vectors.flush()
+    np.save(os.path.join(index_dir, 'offsets.npy'), offsets)
+    clusters = min(clusters, len(vectors))
+    if clusters > 0:
+        centroids = kmeans(vectors, clusters, seed)
+        labels = _assign(vectors, centroids)
+        # le righe vengono raggruppate per partizione: quelle della partizione c sono members[starts[c]:starts[c + 1]]
+        members = np.argsort(labels, kind='stable').astype(np.int64)
+        starts = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=clusters))]).astype(np.int64)
+        np.save(os.path.join(index_dir, 'centroids.npy'), centroids)
+        np.save(os.path.join(index_dir, 'members.npy'), members)
+        np.save(os.path.join(index_dir, 'starts.npy'), starts)
+    # percorsi relativi alla directory dell'indice: restano validi se la cartella dei risultati viene spostata
+    with open(os.path.join(index_dir, 'meta.json'), 'w') as file:
+        json.dump({'log_vector': os.path.relpath(log_vector, index_dir), 'log_file': os.path.relpath(log_file, index_dir),
+                   'rows': len(vectors), 'dimension': vectors.shape[1], 'clusters': clusters, 'seed': seed}, file, indent=1)
+    return index_dir
+
+class LogIndex(object):
+    """
+    Indice dei vettori dei log salvato da build_index, aperto in memory map.
+
+    :param index_dir: Directory dell'indice.
+    """
+
+    def __init__(self, index_dir):
+        with open(os.path.join(index_dir, 'meta.json')) as file:
+            self.meta = json.load(file)
+        # os.path.join lascia invariati i percorsi assoluti degli indici costruiti in precedenza
+        self.log_file = os.path.normpath(os.path.join(index_dir, self.meta['log_file']))
+        self.vectors = np.load(os.path.join(index_dir, 'vectors.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(index_dir, 'offsets.npy'), mmap_mode='r')
+        self.centroids = None
+        if self.meta['clusters']:
+            self.centroids = np.load(os.path.join(index_dir, 'centroids.npy'))
+            self.members = np.load(os.path.join(index_dir, 'members.npy'), mmap_mode='r')
+            self.starts = np.load(os.path.join(index_dir, 'starts.npy'))
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def _search_exact(self, queries, k):
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self.vectors), SEARCH_CHUNK_ROWS):
+            block = np.asarray(self.vectors[start:start + SEARCH_CHUNK_ROWS])
+            scores = queries @ block.T
+            rows = np.broadcast_to(np.arange(start, start + len(block), dtype=np.int64), scores.shape)
+            best_scores, best_rows = _top_k(np.hstack([best_scores, scores]), np.hstack([best_rows, rows]), k)
+        return best_scores, best_rows
+
+    def _search_partitions(self, queries, k, nprobe):
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :nprobe]
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            # righe ordinate, così la lettura dalla memory map procede in avanti
+            rows = np.sort(np.concatenate([self.members[self.starts[c]:self.starts[c + 1]] for c in probes[i]]))
+            scores = np.asarray(self.vectors[rows]) @ query
+            scores, rows = _top_k(scores[None, :], rows[None, :], k)
+            best_scores[i, :scores.shape[1]] = scores[0]
+            best_rows[i, :rows.shape[1]] = rows[0]
+        return best_scores, best_rows
+
+    def search(self, queries, k=10, nprobe=None):
+        """
+        Cerca le k righe più simili (similarità coseno) a ogni vettore di queries.
+
+        :param queries: Matrice delle query, una per riga, o un singolo vettore.
+        :param k: Numero di risultati per query.
+        :param nprobe: Partizioni esaminate nella modalità approssimata; None per la ricerca esatta.
+        :return: Tuple (punteggi, righe), matrici di forma (query, k) ordinate per punteggio decrescente.
+                 Nella modalità approssimata le posizioni senza risultato hanno riga -1.
+        """
+        queries = _normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        k = min(k, len(self.vectors))
+        if nprobe and self.centroids is not None:
+            return self._search_partitions(queries, k, nprobe)
+        return self._search_exact(queries, k)
+
+    def line(self, row, log_file=None):
+        """ Testo della riga row del log indicizzato, o di log_file se indicato """
+        with open(log_file or self.log_file, 'rb') as file:
+            file.seek(int(self.offsets[row]))
+            return file.readline().decode('utf-8', 'replace').rstrip('\r\n')
+
+def read_queries(path):
+    """ Vettori di query da un file di testo: un vettore per riga, con o senza parola iniziale e header word2vec """
+    queries = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for number, line in enumerate(file):
+            parts = line.split()
+            if not parts or (number == 0 and len(parts) == 2 and all(part.isdigit() for part in parts)):
+                continue
+            try:
+                queries.append([float(part) for part in parts])
+            except ValueError:
+                queries.append([float(part) for part in parts[1:]])
+    return np.array(queries, dtype=np.float32)
+
+def embed_text(lines, word_model, oov_vectors=None, preprocess=True, strip_prefix=True):
+    """
+    Vettori di query per righe di log come quelle indicizzate, calcolati come in stream_embed.py:
+    prefissi CRI/klog rimossi, variabili rimosse da code/preprocessing.py e media dei vettori delle parole.
+
+    :param lines: Righe di log da cercare.
+    :param word_model: Modello delle parole (embedding.model).
+    :param oov_vectors: Tabella dei vettori OOV in formato word2vec, None per ignorare le parole fuori vocabolario.
+    :param preprocess: Se False code/preprocessing.py non viene eseguito.
+    :param strip_prefix: Se False i prefissi CRI e klog vengono mantenuti.
+    :return: Matrice dei vettori, una riga per riga di lines.
+    """
+    # import locale: stream_embed importa pipeline, che a sua volta importa questo modulo
+    import k8s_preprocess
+    from stage_runner import StageRunner
+    from stream_embed import StreamEmbedder, OOVTable, BatchPreprocessor
+    messages = [k8s_preprocess.parse_line(line)[0] if strip_prefix else line for line in lines]
+    embedder = StreamEmbedder(word_model, OOVTable(oov_vectors) if oov_vectors else None)
+    if not preprocess:
+        return embedder.embed(messages)
+    with StageRunner('inline') as runner, tempfile.TemporaryDirectory(prefix='log_index_') as workdir:
+        return embedder.embed(BatchPreprocessor(runner, workdir)(messages))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Indice dei vettori dei log per cercare le righe più simili.')
+    subparsers = parser.add_subparsers(dest='command')
+    build = subparsers.add_parser('build', help='build an index from log vectors')
+    build.add_argument('-log_vector', help='log vectors, one per line of the log', required=True)
+    build.add_argument('-logs', help='log with one line per vector', required=True)
+    build.add_argument('-o', help='index directory', required=True)
+    build.add_argument('--clusters', help='partitions for approximate search, 0 for exact search only', type=int, default=0)
+    build.add_argument('--seed', help='seed of the clustering', type=int, default=0)
+    query = subparsers.add_parser('query', help='find the log lines most similar to a query')
+    query.add_argument('-index', help='index directory', required=True)
+    group = query.add_mutually_exclusive_group(required=True)
+    group.add_argument('--row', help='use the vector of this line (0-based) of the indexed log', type=int)
+    group.add_argument('--vectors', help='text file with query vectors, one per line')
+    group.add_argument('--text', help='log lines to search, preprocessed and embedded like stream_embed.py', nargs='+')
+    query.add_argument('-k', help='number of results', type=int, default=10)
+    query.add_argument('--nprobe', help='partitions to search, approximate mode', type=int, default=None)
+    query.add_argument('--log', help='indexed log, if it was moved away from the index', type=str, default=None)
+    query.add_argument('-word_model', help='word model for --text, embedding.model next to the index by default', default=None)
+    query.add_argument('-oov_vectors', help='OOV vectors for --text in word2vec format; OOV words are ignored if not given', default=None)
+    query.add_argument('--keep-prefix', help='do not strip CRI and klog prefixes from --text', action='store_true')
+    query.add_argument('--no-preprocess', help='do not run code/preprocessing.py on --text', action='store_true')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_index(args.log_vector, args.logs, args.o, args.clusters, args.seed)
+        print(f'Index saved to {args.o}', flush=True)
+    elif args.command == 'query':
+        index = LogIndex(args.index)
+        if args.row is not None:
+            queries = index.vectors[[args.row]]
+        elif args.text:
+            word_model = args.word_model or os.path.join(os.path.dirname(os.path.abspath(args.index)), 'embedding.model')
+            queries = embed_text(args.text, word_model, args.oov_vectors, not args.no_preprocess, not args.keep_prefix)
+        else:
+            queries = read_queries(args.vectors)
+        scores, rows = index.search(queries, args.k, args.nprobe)
+        for i in range(len(queries)):
+            if len(queries) > 1:
+                print(f'# query {i}')
+            for score, row in zip(scores[i], rows[i]):
+                if row >= 0:
+                    print(f'{score:.4f}\t{row}\t{index.line(row, args.log)}')
+    else:
+        parser.print_help()
@@ -1,156 +1,345 @@
 import os
+import time
+import shutil
 import argparse
-import random
 import string
 import pickle
-import gensim
+import itertools
 import numpy as np
-def cos( vector1, vector2):
-    return float(np.sum(vector1*vector2))/(np.linalg.norm(vector1)*np.linalg.norm(vector2))
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import k8s_preprocess
+import dedup
+import vector_store
+import log_index
+import results_store
+from profiling import Profiler
+from evaluation import evaluate, NoPairsError
+from stage_cache import StageCache, file_digest
+from stage_manifest import StageManifest
+from stage_runner import StageRunner, StageError, StageTimeout
 
-def preprocess_log(ipath, opath):
+# Parametri del training di lrcwe e di mimick
+LRCWE_PARAMS = {'belta-rel': 0.8, 'alpha-rel': 0.01, 'alpha-ant': 0.3, 'size': 32, 'min-count': 1, 'window': 2}
+MIMICK_PARAMS = {'learning_rate': 0.006, 'epoch': 20, 'num_of_layers': 1, 'dropout': -1, 'hidden_dim': 250, 'ch_dim': 36}
+
+# Righe del log lette e modificate per ogni batch durante la generazione delle parole OOV
+OOV_BATCH_SIZE = 4096
+
+# Tempi, CPU, memoria e dimensione dei file di ogni fase di questo processo
+profiler = Profiler()
+
+# Fasi e iterazioni completate, per riprendere un'esecuzione interrotta con --resume
+manifest = StageManifest()
+# Tempo massimo in secondi delle fasi, per nome della fase (--stage-budget)
+stage_budgets = {}
+
+def preprocess_log(ipath, opath, runner, jobs=1, strip_prefix=True):
     #preprocess
     processed_log = os.path.join(opath, 'without_variables.log')
-    command_for_preprocessing = "python code/preprocessing.py -rawlog %s -o %s"%(ipath, processed_log)
-    os.system(command_for_preprocessing)
+    if manifest.done('preprocessing', [processed_log]):
+        print('[resume] preprocessing', flush=True)
+        return processed_log
+    # Il log viene ripulito dai prefissi CRI/klog e diviso in chunk elaborati in parallelo
+    chunk_dir = os.path.join(opath, 'preprocess_chunks')
+    with profiler.stage('split_log', [ipath]):
+        chunks = k8s_preprocess.split_log(ipath, chunk_dir, jobs, strip_prefix)
+    outputs = [chunk + '.out' for chunk in chunks]
+    commands = [['code/preprocessing.py', '-rawlog', chunk, '-o', output] for chunk, output in zip(chunks, outputs)]
+    budget = stage_budgets.get('preprocessing')
+    with profiler.stage('preprocessing', chunks, outputs) as info:
+        if len(commands) == 1:
+            info.update(runner.run(commands[0], budget))
+        else:
+            chunk_runner = StageRunner('subprocess')
+            # il budget vale per l'intera fase: ogni chunk riceve il tempo che resta quando parte
+            deadline = time.time() + budget if budget is not None else None
+            def run_chunk(command):
+                if deadline is None:
+                    return chunk_runner.run(command)
+                remaining = deadline - time.time()
+                if remaining > 0:
+                    try:
+                        return chunk_runner.run(command, remaining)
+                    except StageTimeout:
+                        pass
+                # l'errore riporta il budget della fase, non il tempo rimasto al chunk
+                raise StageTimeout(command, budget)
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                list(executor.map(run_chunk, commands))
+    k8s_preprocess.concatenate(outputs, processed_log)
+    shutil.rmtree(chunk_dir)
+    manifest.complete('preprocessing', [processed_log])
     return processed_log
 
-def generate_oov(processed_log, opath):
-    generate_file_path = os.path.join(opath, 'changed_log')
-    if not os.path.exists(generate_file_path):
-        os.mkdir(generate_file_path)
-    changed_log = os.path.join(generate_file_path, "without_variables.log")
-    new_vocab =  os.path.join(generate_file_path, "vocab.txt")
-    old_to_new_dict = os.path.join(generate_file_path, "old_new_dict.txt")
+class OOVVariant(object):
+    # Stato di una variante OOV: file di output, generatore e vocabolario modificato
+
+    def __init__(self, opath, seed):
+        generate_file_path = os.path.join(opath, 'changed_log')
+        if not os.path.exists(generate_file_path):
+            os.makedirs(generate_file_path)
+        self.changed_log = os.path.join(generate_file_path, "without_variables.log")
+        self.new_vocab =  os.path.join(generate_file_path, "vocab.txt")
+        self.old_to_new_dict = os.path.join(generate_file_path, "old_new_dict.txt")
+        self.rng = np.random.default_rng(seed)
+        self.file = open(self.changed_log, 'w')
+        # dizionari usati come insiemi ordinati, così l'output dipende solo dal seed
+        self.new_words = {}
+        self.old_new_dict = {}
+
+    def perturb(self, batch, lengths):
+        # posizioni di parola, lettera e lettera sostitutiva estratte per tutto il batch
+        target_words = (self.rng.random(len(batch)) * lengths).astype(np.int64)
+        letter_draws = self.rng.random(len(batch))
+        change_letters = self.rng.integers(0, 26, len(batch))
+        temp_result = []
+        for log_in_word, log_length, target_word, letter_draw, change_letter in zip(
+                batch, lengths, target_words, letter_draws, change_letters):
+            if log_length == 0:
+                temp_result.append('\n')
+                continue
+            log_in_word = list(log_in_word)
+            # una parola già sostituita in una riga precedente lascia il posto alla successiva;
+            # in origine il test era fatto sul percorso del file del dizionario e non scattava quasi mai
+            if log_in_word[target_word] in self.old_new_dict:
+                target_word = (target_word + 1) % log_length
+            word_length = len(log_in_word[target_word])
+            target_letter = int(letter_draw * word_length)
+            if log_in_word[target_word][target_letter].lower() == string.ascii_lowercase[change_letter]:
+                change_letter = (change_letter + 1) % 26
+            old = log_in_word[target_word]
+            log_in_word[target_word] = (log_in_word[target_word][:target_letter]
+                                        + string.ascii_lowercase[change_letter]
+                                        + log_in_word[target_word][target_letter+1:] )
+            self.new_words[log_in_word[target_word]+'\n'] = None
+            self.old_new_dict.setdefault(old, {})[log_in_word[target_word]] = None
+            temp_result.append(' '.join(log_in_word)+'\n')
+        self.file.write(''.join(temp_result))
+
+    def close(self):
+        self.file.close()
+        with open(self.new_vocab, 'w') as file:
+            file.writelines(self.new_words)
+        with open(self.old_to_new_dict, 'wb') as file:
+            old_new_dict = dict((key, list(value)) for key, value in self.old_new_dict.items())
+            file.write(pickle.dumps(old_new_dict))
+        return self.new_vocab, self.old_to_new_dict
+
+def oov_seed(seed, iteration):
+    # seed indipendente per ogni iterazione, derivato dal seed della run
+    return np.random.SeedSequence(seed, spawn_key=(iteration,))
+
+def generate_oov_variants(processed_log, workspaces, seeds, batch_size=OOV_BATCH_SIZE):
+    # Genera una variante OOV per ogni workspace leggendo il log una sola volta, a batch di righe
+    variants = [OOVVariant(workspace, seed) for workspace, seed in zip(workspaces, seeds)]
     with open(processed_log, 'r') as file:
-        logs = file.readlines()
-    temp_result = []
-    new_words = set()
-    old_new_dict = {}
-    for log in logs:
-        log_in_word = log.split()
-        log_length = len(log_in_word)
-        target_word = random.randint(0,log_length-1) 
-        if log_in_word[target_word] in old_to_new_dict:
-            target_word = (target_word + 1) % log_length
-        word_length = len(log_in_word[target_word])
-        target_letter = random.randint(0, word_length-1)
-        change_letter = random.randint(0, 25)
-        if log_in_word[target_word][target_letter].lower() == string.ascii_lowercase[change_letter]:
-            change_letter = (change_letter + 1) % 26
-        old = log_in_word[target_word] 
-        log_in_word[target_word] = (log_in_word[target_word][:target_letter] 
-                                    + string.ascii_lowercase[change_letter] 
-                                    + log_in_word[target_word][target_letter+1:] )
-        new_words.add(log_in_word[target_word]+'\n')
-        if old in old_new_dict:
-            old_new_dict[old].append(log_in_word[target_word])
-        else:
-            old_new_dict[old] = [log_in_word[target_word]]
-        temp_result.append(' '.join(log_in_word)+'\n')
-    with open(changed_log, 'w') as file:
-        file.writelines(temp_result)
-    with open(new_vocab, 'w') as file:
-        file.writelines(new_words)
-    with open(old_to_new_dict, 'wb') as file:
-        for key in old_new_dict:
-            old_new_dict[key] = list(set(old_new_dict[key]))
-        file.write(pickle.dumps(old_new_dict))
-    return new_vocab, old_to_new_dict
-
-def pipeline(processed_log, new_vocab):
+        while True:
+            batch = [log.split() for log in itertools.islice(file, batch_size)]
+            if not batch:
+                break
+            lengths = np.fromiter((len(log_in_word) for log_in_word in batch), dtype=np.int64, count=len(batch))
+            for variant in variants:
+                variant.perturb(batch, lengths)
+    return [variant.close() for variant in variants]
+
+def generate_oov(processed_log, opath, seed=None):
+    return generate_oov_variants(processed_log, [opath], [seed])[0]
+
+def run_stage(cache, runner, stage, command, inputs, outputs, params, resumable=True):
+    if resumable and manifest.done(stage, outputs.values()):
+        print(f'[resume] {stage}', flush=True)
+        return
+    with profiler.stage(stage, inputs.values(), outputs.values()) as info:
+        def action():
+            info.update(runner.run(command, stage_budgets.get(stage)))
+        hit = cache.run(stage, inputs, outputs, params, action)
+        info['cached'] = hit
+    print('------')
+    print(('[cache hit] ' if hit else '') + ' '.join(str(part) for part in command), flush=True)
+    if resumable:
+        manifest.complete(stage, outputs.values())
+
+def dedup_log(processed_log, opath):
+    # Le righe ripetute vengono ridotte a una sola, con l'indice per tornare alle righe originali
+    unique_log = os.path.join(opath, 'unique.log')
+    index_file = os.path.join(opath, 'unique.index.npy')
+    if manifest.done('dedup', [unique_log, index_file]):
+        print('[resume] dedup', flush=True)
+        return unique_log, index_file
+    with profiler.stage('dedup', [processed_log], [unique_log, index_file]) as info:
+        info['lines'], info['unique'] = dedup.dedup_log(processed_log, unique_log, index_file)
+    print(f"Deduplication: {info['lines']} lines, {info['unique']} distinct", flush=True)
+    manifest.complete('dedup', [unique_log, index_file])
+    return unique_log, index_file
+
+def store_vectors(path):
+    # Versione binaria in memory map dei vettori, usata da evaluate() e dagli strumenti a valle
+    matrix_path, keys_path = vector_store.store_paths(path)
+    if manifest.resumed and vector_store.is_fresh(path):
+        return
+    with profiler.stage('vector_store', [path], [matrix_path, keys_path]):
+        vector_store.convert(path)
+
+def train(processed_log, opath, cache, runner, deduplicate=True, lrcwe_params=LRCWE_PARAMS, log_vectors=True):
     
+    # Le fasi di training leggono tutte le righe del log: frequenze e co-occorrenze delle parole restano invariate
+    training_log = processed_log
+
     # Antonyms&Synonyms Extraction
     sys_output = os.path.join(opath, 'sys.txt')
     ants_output = os.path.join(opath, 'ants.txt')
-    command_for_AS_extraction = '''python code/get_syn_ant.py -logs %s -ant_file %s -syn_file %s'''%(processed_log, ants_output, sys_output)
-    os.system(command_for_AS_extraction)
+    command_for_AS_extraction = ['code/get_syn_ant.py', '-logs', training_log, '-ant_file', ants_output, '-syn_file', sys_output]
+    run_stage(cache, runner, 'syn_ant', command_for_AS_extraction,
+              {'script': 'code/get_syn_ant.py', 'logs': training_log},
+              {'ants': ants_output, 'syn': sys_output}, {})
 
     # Relation Triple Extraction
-    triplet_log = 'triples.txt'
-    command_for_triplet = '''python code/get_triplet.py %s %s'''%(processed_log, triplet_log)
-    os.system(command_for_triplet)
+    triplet_log = os.path.join(opath, 'triples.txt')
+    command_for_triplet = ['code/get_triplet.py', training_log, triplet_log]
+    run_stage(cache, runner, 'triplet', command_for_triplet,
+              {'script': 'code/get_triplet.py', 'logs': training_log},
+              {'triplet': triplet_log}, {})
 
     # Semantic Word Embedding
     train_log = os.path.join(opath, 'for_training.log')
-    command_for_train = "python code/getTempLogs.py -input %s -output %s" %(processed_log, train_log)
-    print(command_for_train)
-    os.system(command_for_train)
+    command_for_train = ['code/getTempLogs.py', '-input', training_log, '-output', train_log]
+    run_stage(cache, runner, 'temp_logs', command_for_train,
+              {'script': 'code/getTempLogs.py', 'logs': training_log},
+              {'train': train_log}, {})
 
     # Semantic Word Embedding
     train_model = os.path.join(opath, 'embedding.model')
     vocab = os.path.join(opath, 'embedding.vocab')
-    command_for_model = ('''code/LRWE/src/lrcwe -train %s -synonym %s -antonym %s -output %s -save-vocab %s -belta-rel 0.8 -alpha-rel 0.01 -alpha-ant 0.3 -size 32 -min-count 1 -window 2 -triplet %s'''
-                         %(train_log, sys_output,
-                           ants_output, train_model,
-                           vocab, triplet_log))
-    os.system(command_for_model)
-    print('------')
-    print(command_for_model)
+    command_for_model = ['code/LRWE/src/lrcwe', '-train', train_log, '-synonym', sys_output, '-antonym', ants_output,
+                         '-output', train_model, '-save-vocab', vocab]
+    for name, value in lrcwe_params.items():
+        command_for_model += ['-' + name, value]
+    command_for_model += ['-triplet', triplet_log]
+    run_stage(cache, runner, 'lrcwe', command_for_model,
+              {'binary': 'code/LRWE/src/lrcwe', 'train': train_log, 'syn': sys_output,
+               'ants': ants_output, 'triplet': triplet_log},
+              {'model': train_model, 'vocab': vocab}, lrcwe_params)
+    store_vectors(train_model)
 
     oov_words = os.path.join(opath, 'words.pkl')
-    command_for_oov = "python code/mimick/make_dataset.py --vectors %s --w2v-format --output %s"%(train_model, oov_words)
-    os.system(command_for_oov)
-    print('------')
-    print(command_for_oov)
+    command_for_oov = ['code/mimick/make_dataset.py', '--vectors', train_model, '--w2v-format', '--output', oov_words]
+    run_stage(cache, runner, 'make_dataset', command_for_oov,
+              {'script': 'code/mimick/make_dataset.py', 'vectors': train_model},
+              {'words': oov_words}, {})
+    if not log_vectors:
+        return train_model, oov_words
 
-    oov_vector = os.path.join(opath, 'oov.vector')
-    learning_rate = 0.006
-    epoch = 20
-    num_of_layers = 1
-    dropout = -1
-    hidden_dim = 250
-    ch_dim = 36
-    command_for_new_embedding = ("python code/mimick/model.py --dataset %s  --vocab %s --output %s --num-epochs %d --learning-rate %f --num-lstm-layers %d --cosine --dropout %f --all-from-mimick --hidden-dim %d --char-dim %d"
-                                 %(oov_words, new_vocab, oov_vector, epoch, learning_rate, num_of_layers, dropout, hidden_dim, ch_dim))
-    os.system(command_for_new_embedding)
-    print('------')
-    print(command_for_new_embedding)
+    # Il vettore di una riga dipende solo dal suo testo e dal modello: con la deduplicazione
+    # viene calcolato una volta per ogni riga distinta e poi copiato sulle sue occorrenze
+    if deduplicate:
+        vector_log, index_file = dedup_log(processed_log, opath)
+    else:
+        vector_log = processed_log
 
     # get log2vec
     log_vector =  os.path.join(opath, 'log.vector')
-    command_for_log2vec = " python code/Log2Vec.py -logs %s -word_model %s -log_vector_file %s -dimension 32"%(processed_log, train_model, log_vector)
-    os.system(command_for_log2vec)
-    print('------')
-    print(command_for_log2vec)
-    return train_model, oov_vector
-
-
-def evaluate(word_model_path, old_to_new_dict, oov_vector_path, opath):
-    word2vec = gensim.models.KeyedVectors.load_word2vec_format(word_model_path, binary = False)
-    oov_vec = gensim.models.KeyedVectors.load_word2vec_format(oov_vector_path, binary = False)
-    with open(old_to_new_dict, 'rb') as file:
-        old_new_dict = pickle.loads(file.read())
-    total_score = 0
-    count = 0
-    result = []
-    for key in old_new_dict:
-        for new_word in old_new_dict[key]:
-            if key not in word2vec:
-                print(key)
-                continue
-            score = cos(word2vec[key], oov_vec[new_word])
-            total_score += score
-            count += 1
-            result.append((key, new_word, score))
-    score_path = os.path.join(opath, 'score')
-    if not os.path.exists(score_path):
-        os.mkdir(score_path)
-    with open(os.path.join(score_path, 'score'), 'w') as ofile:
-        ofile.write('score: '+str(total_score/count)+'\n')
-    with open(os.path.join(score_path, 'result.txt'), 'w') as ofile:
-        for i in result:
-            ofile.write(i[0]+ ' '+i[1]+' '+str(i[2])+'\n')
- 
-    return total_score/count, result
+    unique_vector = os.path.join(opath, 'unique.vector') if deduplicate else log_vector
+    command_for_log2vec = ['code/Log2Vec.py', '-logs', vector_log, '-word_model', train_model,
+                           '-log_vector_file', unique_vector, '-dimension', lrcwe_params['size']]
+    run_stage(cache, runner, 'log2vec', command_for_log2vec,
+              {'script': 'code/Log2Vec.py', 'logs': vector_log, 'word_model': train_model},
+              {'log_vector': unique_vector}, {'dimension': lrcwe_params['size']})
+    if deduplicate and not manifest.done('expand_log_vector', [log_vector]):
+        # ogni riga del log riceve il vettore della sua riga distinta
+        with profiler.stage('expand_log_vector', [unique_vector, index_file], [log_vector]):
+            dedup.expand_vectors(unique_vector, index_file, log_vector)
+        manifest.complete('expand_log_vector', [log_vector])
+    store_vectors(log_vector)
+
+    # indice per cercare le righe più simili; con la deduplicazione ogni riga distinta compare una sola volta
+    index_dir = os.path.join(opath, 'log_index')
+    index_files = [os.path.join(index_dir, name) for name in ('vectors.npy', 'offsets.npy', 'meta.json')]
+    if not manifest.done('log_index', index_files):
+        with profiler.stage('log_index', [unique_vector, vector_log]):
+            log_index.build_index(unique_vector, vector_log, index_dir)
+        manifest.complete('log_index', index_files)
+    return train_model, oov_words
+
+def mimick_command(oov_words, new_vocab, oov_vector, params=MIMICK_PARAMS):
+    return ['code/mimick/model.py', '--dataset', oov_words, '--vocab', new_vocab, '--output', oov_vector,
+            '--num-epochs', '%d' % params['epoch'],
+            '--learning-rate', '%f' % params['learning_rate'],
+            '--num-lstm-layers', '%d' % params['num_of_layers'], '--cosine',
+            '--dropout', '%f' % params['dropout'], '--all-from-mimick',
+            '--hidden-dim', '%d' % params['hidden_dim'],
+            '--char-dim', '%d' % params['ch_dim']]
+
+def embed_oov(oov_words, new_vocab, opath, cache, runner, mimick_params=MIMICK_PARAMS):
+    oov_vector = os.path.join(opath, 'oov.vector')
+    command_for_new_embedding = mimick_command(oov_words, new_vocab, oov_vector, mimick_params)
+    run_stage(cache, runner, 'mimick', command_for_new_embedding,
+              {'script': 'code/mimick/model.py', 'dataset': oov_words, 'vocab': new_vocab},
+              {'oov': oov_vector}, mimick_params, resumable=False)
+    store_vectors(oov_vector)
+    return oov_vector
+
+def run_iteration(train_model, oov_words, new_vocab, old_to_new_dict, workspace, cache, runner,
+                  store=None, run_id=None, iteration=None, mimick_params=MIMICK_PARAMS):
+    oov_vector = embed_oov(oov_words, new_vocab, workspace, cache, runner, mimick_params)
+    with profiler.stage('evaluate', [train_model, old_to_new_dict, oov_vector]):
+        score, result = evaluate(train_model, old_to_new_dict, oov_vector, workspace, store, run_id, iteration)
+    return score
+
+# Runner del processo del pool, riusato da tutte le iterazioni eseguite dallo stesso processo
+_pool_runner = None
+
+def parallel_iteration(iteration, train_model, oov_words, new_vocab, old_to_new_dict, workspace, cache, store, run_id):
+    global _pool_runner
+    # I processi del pool ereditano le statistiche della cache e gli eventi del profiler dal padre
+    cache.stats = {}
+    profiler.events = []
+    if _pool_runner is None:
+        _pool_runner = StageRunner('inline')
+    profiler.iteration = iteration
+    with profiler.stage('iteration'):
+        score = run_iteration(train_model, oov_words, new_vocab, old_to_new_dict, workspace, cache, _pool_runner,
+                              store, run_id, iteration)
+    profiler.iteration = None
+    return score, cache.stats, profiler.events
+
+def write_scores(results_file, scores):
+    # Riscritto dopo ogni iterazione, in modo atomico, così i risultati parziali restano leggibili
+    tmp_file = f'{results_file}.tmp{os.getpid()}'
+    with open(tmp_file, 'w') as f:
+        for i in sorted(scores):
+            f.write(f'Iteration {i+1}: {scores[i]}\n')
+    os.replace(tmp_file, results_file)
+
+def parse_budgets(values):
+    # Converte una lista di stringhe fase=secondi in un dizionario
+    budgets = {}
+    for value in values or ():
+        stage, _, seconds = value.partition('=')
+        budgets[stage] = float(seconds)
+    return budgets
+
 
 if __name__ == '__main__':
+    main_start = time.time()
     parser = argparse.ArgumentParser()
     parser.add_argument('-i', help='input_file')
     parser.add_argument('-o', help='output directory', type=str, default=None)
     parser.add_argument('-t', help='log type')
     parser.add_argument('-n', help='number of iterations', type=int, default=10)  # Aggiungi un argomento per le iterazioni
+    parser.add_argument('--no-cache', help='disable the stage cache', action='store_true')
+    parser.add_argument('--jobs', help='number of parallel processes for preprocessing and iterations, each iteration in its own workspace', type=int, default=1)
+    parser.add_argument('--keep-prefix', help='do not strip CRI and klog prefixes before preprocessing', action='store_true')
+    parser.add_argument('--seed', help='seed of the OOV generation, random if not given', type=int, default=None)
+    parser.add_argument('--no-dedup', help='compute a log vector for every preprocessed line instead of once per distinct line', action='store_true')
+    parser.add_argument('--db', help='SQLite results store, <output>/<log type>/results.db by default', type=str, default=None)
+    parser.add_argument('--runner', help='how python stages are run', choices=['worker', 'inline', 'subprocess'], default='worker')
+    parser.add_argument('--resume', help='skip the stages and iterations already completed according to <output>/<log type>/manifest.json', action='store_true')
+    parser.add_argument('--stage-budget', help='time budget of a stage, e.g. lrcwe=300 or mimick=120; the stage is stopped when it runs over', action='append', metavar='STAGE=SECONDS')
     args = parser.parse_args()
+    try:
+        stage_budgets = parse_budgets(args.stage_budget)
+    except ValueError:
+        parser.error('--stage-budget expects STAGE=SECONDS')
     
     ipath = args.i
     ipath = os.path.abspath(ipath)
@@ -170,28 +359,116 @@ if __name__ == '__main__':
     if not os.path.exists(opath):
         os.mkdir(opath)
     
-    processed_log = preprocess_log(ipath, opath)
-    
-    all_scores = []
-    
-    for i in range(args.n):  # Esegui il ciclo per il numero di iterazioni specificato
-        print(f'Running iteration {i+1}/{args.n}', flush=True)
-        new_vocab, old_to_new_dict = generate_oov(processed_log, opath)
-        train_model, oov_vector = pipeline(processed_log, new_vocab)
-        score, result = evaluate(train_model, old_to_new_dict, oov_vector, opath)
-        print('---------', flush=True)
-        print(score, flush=True)
-        all_scores.append(score)
-        
+    # Un manifest scritto con un altro input o altri parametri non viene ripreso
+    signature = {'input': file_digest(ipath), 'log_type': log_type, 'strip_prefix': not args.keep_prefix,
+                 'dedup': not args.no_dedup, 'lrcwe': LRCWE_PARAMS, 'mimick': MIMICK_PARAMS}
+    manifest = StageManifest(os.path.join(opath, 'manifest.json'), signature, args.resume)
+    if manifest.resumed:
+        print(f'Resuming from {manifest.path}', flush=True)
 
+    container_start = os.environ.get('LOG2VEC_CONTAINER_START')
+    if container_start:
+        # Tempo dall'avvio di run_log2vec.sh all'avvio della pipeline: compilazione di lrcwe, input e import
+        startup = main_start - float(container_start)
+        profiler.add_event('startup', startup, float(container_start))
+        print(f'Container startup: {startup:.2f} s', flush=True)
 
-    
-    # Salva tutti i risultati in un file
-    results_file = os.path.join(output_path, 'all_scores.txt')
-    with open(results_file, 'w') as f:
-        for i, score in enumerate(all_scores):
-            f.write(f'Iteration {i+1}: {score}\n')
-    
-    print(f'Results saved to {results_file}', flush=True)
+    # Le fasi Python girano in un worker che mantiene caricati librerie e modelli;
+    # il worker parte subito, così il caricamento dei modelli si sovrappone alla divisione del log
+    runner = StageRunner(args.runner)
+    runner.start()
+    jobs = max(1, min(args.jobs, os.cpu_count() or 1))
+    processed_log = preprocess_log(ipath, opath, runner, jobs, not args.keep_prefix)
 
+    # Le fasi che non dipendono dal vocabolario OOV vengono eseguite una sola volta
+    cache = StageCache(os.path.join(output_path, '.stage_cache'), enabled=not args.no_cache)
     
+    train_model, oov_words = train(processed_log, opath, cache, runner, not args.no_dedup)
+    results_file = os.path.join(opath, 'all_scores.txt')
+    all_scores = {}
+    seed = args.seed if args.seed is not None else manifest.get('seed')
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    if manifest.get('seed') not in (None, seed):
+        # le iterazioni completate con un altro seed non valgono per questa esecuzione
+        manifest.set('iterations', {})
+    manifest.set('seed', seed)
+    print(f'OOV seed: {seed}', flush=True)
+    failed = []
+    for i in range(args.n):
+        if manifest.score(i + 1) is not None:
+            all_scores[i] = manifest.score(i + 1)
+    if all_scores:
+        print(f'{len(all_scores)} iterations already completed', flush=True)
+        write_scores(results_file, all_scores)
+
+    # Punteggi di ogni iterazione e coppia, indicizzati per tipo di log, esecuzione e iterazione
+    store = results_store.ResultsStore(args.db or os.path.join(opath, 'results.db'))
+    run_id = store.add_run(results_store.log_type(args.t), args.t, seed,
+                           {'iterations': args.n, 'lrcwe': LRCWE_PARAMS, 'mimick': MIMICK_PARAMS})
+
+    if args.jobs == 1:
+        for i in range(args.n):  # Esegui il ciclo per il numero di iterazioni specificato
+            if i in all_scores:
+                continue
+            print(f'Running iteration {i+1}/{args.n}', flush=True)
+            profiler.iteration = i + 1
+            try:
+                with profiler.stage('iteration'):
+                    with profiler.stage('generate_oov', [processed_log]):
+                        new_vocab, old_to_new_dict = generate_oov(processed_log, opath, oov_seed(seed, i))
+                    score = run_iteration(train_model, oov_words, new_vocab, old_to_new_dict, opath, cache, runner,
+                                          store, run_id, i + 1)
+            except (StageError, NoPairsError) as e:
+                # un'iterazione fallita (una fase o la valutazione senza coppie valutabili)
+                # non ferma le altre, verrà rieseguita con --resume
+                print(f'Iteration {i+1} failed: {e}', flush=True)
+                failed.append(i + 1)
+                continue
+            finally:
+                profiler.iteration = None
+            print('---------', flush=True)
+            print(score, flush=True)
+            all_scores[i] = score
+            manifest.record_iteration(i + 1, score)
+            write_scores(results_file, all_scores)
+    else:
+        # Ogni iterazione lavora in una propria directory, le iterazioni girano in un pool di processi
+        todo = [i for i in range(args.n) if i not in all_scores]
+        workers = max(1, min(jobs, len(todo)))
+        print(f'Running {len(todo)} iterations on {workers} processes', flush=True)
+        workspaces = dict((i, os.path.join(opath, f'iteration_{i+1}')) for i in todo)
+        with profiler.stage('generate_oov', [processed_log]):
+            variants = generate_oov_variants(processed_log, [workspaces[i] for i in todo], [oov_seed(seed, i) for i in todo])
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for i, (new_vocab, old_to_new_dict) in zip(todo, variants):
+                future = executor.submit(parallel_iteration, i + 1, train_model, oov_words, new_vocab, old_to_new_dict,
+                                         workspaces[i], cache, store, run_id)
+                futures[future] = i
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    score, stats, events = future.result()
+                except (StageError, NoPairsError) as e:
+                    print(f'Iteration {i+1} failed: {e}', flush=True)
+                    failed.append(i + 1)
+                    continue
+                cache.merge(stats)
+                profiler.merge(events)
+                print(f'Iteration {i+1}/{args.n}: {score}', flush=True)
+                all_scores[i] = score
+                manifest.record_iteration(i + 1, score)
+                write_scores(results_file, all_scores)
+
+    runner.close()
+    if runner.preload_time is not None:
+        profiler.add_event('worker_preload', runner.preload_time)
+    store.close()
+    print(f'Results saved to {results_file} and {store.path}', flush=True)
+    print(cache.report(), flush=True)
+    profiler.save(os.path.join(opath, 'profile.json'), os.path.join(opath, 'profile.trace.json'))
+    print(profiler.summary(), flush=True)
+    if failed:
+        print(f"Failed iterations: {', '.join(str(i) for i in sorted(failed))}, rerun with --resume", flush=True)
+        raise SystemExit(1)
@@ -3,10 +3,17 @@ import numpy as np
 import matplotlib.pyplot as plt
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from results_store import ResultsStore, log_type
 
 # Configurazione del logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Punti massimi disegnati per ogni curva CDF
+MAX_PLOT_POINTS = 2000
+# Intervalli dello sketch dei quantili: con punteggi coseno in [-1, 1] l'errore sul punteggio è al più 2 / SKETCH_BINS
+SKETCH_BINS = 65536
+
 def read_scores(file_path):
     """
     Legge i punteggi dal file specificato e restituisce una lista di punteggi.
@@ -38,26 +45,180 @@ def read_scores(file_path):
         
     return scores
 
+def read_pair_scores(file_path):
+    """
+    Legge i punteggi delle singole coppie da un file result.txt (righe "parola parola_oov punteggio").
+
+    :param file_path: Percorso del file result.txt.
+    :return: Array numpy dei punteggi.
+    """
+    try:
+        with open(file_path, 'rb') as file:
+            values = [line.rsplit(None, 1)[-1] for line in file.read().split(b'\n') if line.strip()]
+        return np.array(values).astype(np.float64) if values else np.empty(0)
+    except Exception as e:
+        logging.error(f"Errore nella lettura del file {file_path}: {e}")
+        return np.empty(0)
+
+# Nome dei file letti e funzione di lettura per ogni tipo di punteggio
+SCORE_SOURCES = {
+    'score': ('score', lambda path: np.array(read_scores(path), dtype=np.float64)),
+    'result': ('result.txt', read_pair_scores),
+}
+
+def _scan(directory, file_name):
+    # File cercati e sottocartelle di una singola directory
+    found = []
+    subdirs = []
+    for entry in os.scandir(directory):
+        if entry.is_dir(follow_symlinks=False):
+            subdirs.append(entry.path)
+        elif entry.name == file_name:
+            found.append(entry.path)
+    return found, subdirs
+
+def find_files(source_dir, file_name='score', jobs=8):
+    """
+    Cerca in parallelo tutti i file chiamati file_name nelle sottocartelle di source_dir:
+    ogni directory viene letta da un thread appena è stata scoperta.
+
+    :return: Lista ordinata dei percorsi trovati.
+    """
+    files = []
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = {executor.submit(_scan, source_dir, file_name)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                found, subdirs = future.result()
+                files.extend(found)
+                pending |= set(executor.submit(_scan, subdir, file_name) for subdir in subdirs)
+    return sorted(files)
+
+def group_name(file_path, source_dir, group_by):
+    """
+    Gruppo a cui appartiene un file di punteggi.
+
+    :param group_by: None per un solo gruppo, 'run' per cartella di primo livello, 'log_type' per tipo di log.
+    """
+    if group_by is None:
+        return os.path.basename(os.path.normpath(source_dir))
+    parts = os.path.relpath(file_path, source_dir).split(os.sep)
+    run = parts[0] if len(parts) > 2 else os.path.basename(os.path.normpath(source_dir))
+    return run if group_by == 'run' else log_type(run)
+
+class QuantileSketch(object):
+    """
+    Sketch in streaming della distribuzione dei punteggi: un istogramma a intervalli fissi su [low, high],
+    con memoria costante indipendente dal numero di punteggi e unibile tra sketch diversi.
+    I valori fuori dall'intervallo vengono contati nel primo o nell'ultimo intervallo.
+    """
+
+    def __init__(self, bins=SKETCH_BINS, low=-1.0, high=1.0):
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.low = low
+        self.high = high
+        self.min = np.inf
+        self.max = -np.inf
+
+    def __len__(self):
+        return int(self.counts.sum())
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        positions = ((values - self.low) / (self.high - self.low) * len(self.counts)).astype(np.int64)
+        self.counts += np.bincount(np.clip(positions, 0, len(self.counts) - 1), minlength=len(self.counts))
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def cdf(self):
+        """ Tuple (punteggi, CDF) con un punto per ogni intervallo non vuoto """
+        edges = self.low + (np.arange(1, len(self.counts) + 1) * (self.high - self.low) / len(self.counts))
+        filled = self.counts > 0
+        scores = np.clip(edges[filled], self.min, self.max)
+        return scores, np.cumsum(self.counts[filled]) / self.counts.sum()
+
+    def quantile(self, q):
+        scores, cdf = self.cdf()
+        return scores[min(np.searchsorted(cdf, q), len(scores) - 1)]
+
+def _add_scores(groups, name, scores, sketch):
+    if sketch:
+        groups.setdefault(name, QuantileSketch()).update(scores)
+    else:
+        groups.setdefault(name, []).append(scores)
+
+def _collect_store(groups, database, source, group_by, sketch, log_types, last, prefix):
+    # Punteggi letti dall'archivio SQLite, a blocchi
+    with ResultsStore(database) as store:
+        cursor = store.fetch_scores(source, log_types, last)
+        while True:
+            rows = cursor.fetchmany(100000)
+            if not rows:
+                break
+            names = [prefix + (os.path.basename(database) if group_by is None else run if group_by == 'run' else kind)
+                     for kind, run, _ in rows]
+            scores = np.array([row[2] for row in rows], dtype=np.float64)
+            unique, inverse = np.unique(names, return_inverse=True)
+            for position, name in enumerate(unique.tolist()):
+                _add_scores(groups, name, scores[inverse == position], sketch)
+
+def collect_scores(source_dirs, source='score', group_by=None, jobs=8, sketch=False, log_types=None, last=None):
+    """
+    Legge in parallelo i punteggi di una o più directory di risultati, senza file intermedi.
+    Una sorgente che è un file viene letta come archivio SQLite di results_store.
+
+    :param source_dirs: Directory principali contenenti le sottocartelle con i file dei punteggi, o database.
+    :param source: 'score' per il punteggio medio di ogni iterazione, 'result' per i punteggi delle singole coppie.
+    :param group_by: None, 'run' o 'log_type', vedi group_name.
+    :param jobs: Numero di thread usati per la ricerca e la lettura dei file.
+    :param sketch: Se True i punteggi di ogni gruppo vengono riassunti in un QuantileSketch invece che conservati.
+    :param log_types: Tipi di log da includere, solo per i database.
+    :param last: Numero di esecuzioni più recenti per tipo di log, solo per i database.
+    :return: Dizionario ordinato gruppo -> array dei punteggi o QuantileSketch.
+    """
+    file_name, reader = SCORE_SOURCES[source]
+    groups = {}
+    for source_dir in source_dirs:
+        if os.path.isfile(source_dir):
+            prefix = os.path.basename(source_dir) + '/' if len(source_dirs) > 1 and group_by is not None else ''
+            _collect_store(groups, source_dir, source, group_by, sketch, log_types, last, prefix)
+            continue
+        files = find_files(source_dir, file_name, jobs)
+        logging.info(f"Trovati {len(files)} file {file_name} in {source_dir}")
+        names = [group_name(path, source_dir, group_by) for path in files]
+        if len(source_dirs) > 1 and group_by is not None:
+            names = [os.path.basename(os.path.normpath(source_dir)) + '/' + name for name in names]
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for name, scores in zip(names, executor.map(reader, files)):
+                _add_scores(groups, name, scores, sketch)
+    if not sketch:
+        groups = dict((name, np.concatenate(parts)) for name, parts in groups.items())
+    return dict(sorted(groups.items()))
+
 def merge_scores(source_dir, output_file):
     """
     Cerca tutti i file chiamati 'score' nelle sottocartelle di 'source_dir' e combina i loro contenuti in un file.
     
     :param source_dir: Directory principale contenente le sottocartelle con i file 'score'.
     :param output_file: Percorso del file di output in cui salvare tutti i punteggi combinati.
+    :return: Array numpy dei punteggi combinati.
     """
-    all_scores = []
-    for root, dirs, files in os.walk(source_dir):
-        for file in files:
-            if file == 'score':
-                file_path = os.path.join(root, file)
-                logging.info(f"Elaborazione del file {file_path}")
-                scores = read_scores(file_path)
-                all_scores.extend(scores)
-    
+    all_scores = np.concatenate([np.empty(0)] + list(collect_scores([source_dir]).values()))
+    write_scores(all_scores, output_file)
+    return all_scores
+
+def write_scores(scores, output_file):
+    """ Salva i punteggi, uno per riga """
     with open(output_file, 'w') as f:
-        for score in all_scores:
-            f.write(f"{score}\n")
-    
+        f.write(''.join(f"{score}\n" for score in np.asarray(scores).tolist()))
     logging.info(f"Tutti i punteggi combinati sono stati salvati in {output_file}")
 
 def calculate_cdf(scores):
@@ -71,63 +232,114 @@ def calculate_cdf(scores):
     cdf = np.arange(1, len(sorted_scores) + 1) / len(sorted_scores)
     return sorted_scores, cdf
 
-def plot_cdf(sorted_scores, cdf, output_path, show_plot=False):
+def downsample_cdf(sorted_scores, cdf, max_points=MAX_PLOT_POINTS):
     """
-    Crea un grafico della CDF a partire dai punteggi e lo salva in un file.
-    
-    :param sorted_scores: Lista dei punteggi ordinati.
-    :param cdf: Lista della CDF calcolata.
+    Riduce una CDF ad al più max_points punti equidistanti nella probabilità cumulativa,
+    mantenendo il primo e l'ultimo punto.
+    """
+    if len(sorted_scores) <= max_points:
+        return sorted_scores, cdf
+    positions = np.unique(np.searchsorted(cdf, np.linspace(cdf[0], cdf[-1], max_points)))
+    positions = positions[positions < len(cdf)]
+    return sorted_scores[positions], cdf[positions]
+
+def plot_cdfs(curves, output_path, show_plot=False, max_points=MAX_PLOT_POINTS):
+    """
+    Disegna una o più CDF sovrapposte nello stesso grafico e lo salva in un file.
+
+    :param curves: Dizionario etichetta -> (punteggi ordinati, CDF); con una sola curva la legenda viene omessa.
     :param output_path: Percorso del file dove salvare il grafico della CDF.
     :param show_plot: Se True, mostra il grafico interattivamente.
+    :param max_points: Punti massimi disegnati per ogni curva.
     """
     plt.figure()
-    plt.plot(sorted_scores, cdf, marker='.', linestyle='none')
+    for label, (sorted_scores, cdf) in curves.items():
+        sorted_scores, cdf = downsample_cdf(np.asarray(sorted_scores), np.asarray(cdf), max_points)
+        plt.plot(sorted_scores, cdf, drawstyle='steps-post', label=label)
     plt.title('CDF of Scores')
     plt.xlabel('Score')
     plt.ylabel('CDF')
     plt.grid(True)
-    
+    if len(curves) > 1:
+        plt.legend()
+
     # Salva il grafico come immagine
     plt.savefig(output_path)
     logging.info(f"Grafico salvato in {output_path}")
-    
+
     if show_plot:
         plt.show()
-    
+
     plt.close()
 
-def main(source_dir, combined_file, cdf_output_path, show_plot):
+def plot_cdf(sorted_scores, cdf, output_path, show_plot=False):
+    """
+    Crea un grafico della CDF a partire dai punteggi e lo salva in un file.
+    
+    :param sorted_scores: Lista dei punteggi ordinati.
+    :param cdf: Lista della CDF calcolata.
+    :param output_path: Percorso del file dove salvare il grafico della CDF.
+    :param show_plot: Se True, mostra il grafico interattivamente.
+    """
+    plot_cdfs({None: (sorted_scores, cdf)}, output_path, show_plot)
+
+def main(source_dir, combined_file, cdf_output_path, show_plot, extra_dirs=(), source='score', group_by=None,
+         sketch=False, jobs=8, max_points=MAX_PLOT_POINTS, log_types=None, last=None):
     """
     Funzione principale per cercare, combinare e tracciare la CDF dei punteggi.
     
-    :param source_dir: Directory principale contenente le sottocartelle con i file 'score'.
+    :param source_dir: Directory principale contenente le sottocartelle con i file 'score', o database dei risultati.
     :param combined_file: Percorso del file in cui salvare tutti i punteggi combinati.
     :param cdf_output_path: Percorso dove salvare il grafico della CDF.
     :param show_plot: Se True, mostra il grafico interattivamente.
+    :param extra_dirs: Altre directory di risultati, disegnate come curve separate.
+    :param source: 'score' o 'result', vedi collect_scores.
+    :param group_by: None, 'run' o 'log_type': una curva per ogni gruppo.
+    :param sketch: Se True usa uno sketch dei quantili; combined_file contiene allora i punti "punteggio CDF".
+    :param jobs: Numero di thread usati per la lettura.
+    :param max_points: Punti massimi disegnati per ogni curva.
+    :param log_types: Tipi di log da includere, solo per i database.
+    :param last: Numero di esecuzioni più recenti per tipo di log, solo per i database.
     """
-    merge_scores(source_dir, combined_file)
-    
-    scores = []
-    try:
-        with open(combined_file, 'r') as file:
-            scores = [float(line.strip()) for line in file]
-    except Exception as e:
-        logging.error(f"Errore nella lettura del file combinato: {e}")
+    source_dirs = [source_dir] + list(extra_dirs)
+    groups = collect_scores(source_dirs, source, group_by, jobs, sketch, log_types, last)
+    if not any(len(scores) for scores in groups.values()):
+        logging.error("Nessun punteggio valido trovato.")
         return
-    
-    if scores:
-        sorted_scores, cdf = calculate_cdf(scores)
-        plot_cdf(sorted_scores, cdf, cdf_output_path, show_plot)
+
+    if sketch:
+        merged = QuantileSketch()
+        for scores in groups.values():
+            merged.merge(scores)
+        curves = dict((f'{name} (n={len(scores)})', scores.cdf()) for name, scores in groups.items() if len(scores))
+        with open(combined_file, 'w') as f:
+            scores, cdf = merged.cdf()
+            f.write(''.join(f"{score} {value}\n" for score, value in zip(scores.tolist(), cdf.tolist())))
+        logging.info(f"CDF approssimata di {len(merged)} punteggi salvata in {combined_file}")
     else:
-        logging.error("Nessun punteggio valido trovato nel file combinato.")
+        write_scores(np.concatenate(list(groups.values())), combined_file)
+        curves = dict((f'{name} (n={len(scores)})', calculate_cdf(scores)) for name, scores in groups.items() if len(scores))
+    if len(curves) == 1:
+        curves = {None: list(curves.values())[0]}
+    plot_cdfs(curves, cdf_output_path, show_plot, max_points)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Cerca, combina e traccia la CDF dei punteggi.')
-    parser.add_argument('source_dir', type=str, help='Directory principale contenente le sottocartelle con i file "score".')
+    parser.add_argument('source_dir', type=str, help='Directory principale contenente le sottocartelle con i file "score", o database dei risultati.')
     parser.add_argument('combined_file', type=str, help='Percorso del file dove salvare tutti i punteggi combinati.')
     parser.add_argument('cdf_output_file', type=str, help='Percorso dove salvare il grafico della CDF.')
     parser.add_argument('--show', action='store_true', help='Mostra il grafico interattivamente.')
+    parser.add_argument('--compare', type=str, nargs='*', default=[], help='Altre directory di risultati da sovrapporre nel grafico.')
+    parser.add_argument('--source', choices=sorted(SCORE_SOURCES), default='score',
+                        help='"score" per i punteggi delle iterazioni, "result" per i punteggi delle singole coppie.')
+    parser.add_argument('--group-by', choices=['run', 'log_type'], default=None, help='Disegna una curva per ogni esecuzione o tipo di log.')
+    parser.add_argument('--sketch', action='store_true', help='Usa uno sketch dei quantili a memoria costante per insiemi molto grandi.')
+    parser.add_argument('--jobs', type=int, default=8, help='Numero di thread per la ricerca e la lettura dei file.')
+    parser.add_argument('--max-points', type=int, default=MAX_PLOT_POINTS, help='Punti massimi disegnati per ogni curva.')
+    parser.add_argument('--log-type', type=str, nargs='*', default=None, help='Tipi di log da includere (solo database).')
+    parser.add_argument('--last', type=int, default=None, help='Ultime N esecuzioni per tipo di log (solo database).')
 
     args = parser.parse_args()
-    
-    main(args.source_dir, args.combined_file, args.cdf_output_file, args.show)
\ No newline at end of file
+
+    main(args.source_dir, args.combined_file, args.cdf_output_file, args.show, args.compare, args.source,
+         args.group_by, args.sketch, args.jobs, args.max_points, args.log_type, args.last)
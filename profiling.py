@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import resource
+from contextlib import contextmanager
+
+def _cpu_time():
+    usage_self = resource.getrusage(resource.RUSAGE_SELF)
+    usage_children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage_self.ru_utime + usage_self.ru_stime + usage_children.ru_utime + usage_children.ru_stime
+
+def _maxrss():
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+def _sizes(paths):
+    return dict((path, os.path.getsize(path)) for path in paths if os.path.isfile(path))
+
+class Profiler(object):
+    """
+    Raccoglie per ogni fase e iterazione il tempo reale, il tempo di CPU, il picco di memoria (KB)
+    e la dimensione dei file di input e di output.
+    Per le fasi eseguite dallo StageRunner CPU e memoria sono quelle riportate dal runner, che azzera il
+    picco del worker prima di ogni fase quando /proc/self/clear_refs è scrivibile. Per gli altri blocchi,
+    e quando l'azzeramento non è possibile, il picco è quello del processo dal suo avvio ('maxrss_scope'
+    'process'): nel riepilogo quelle fasi sono segnate con *.
+    Un blocco che racchiude altre fasi (ad esempio 'iteration') non conta la CPU usata dal worker persistente.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.iteration = None
+
+    @contextmanager
+    def stage(self, name, inputs=(), outputs=()):
+        """
+        Misura il blocco di codice come fase name dell'iterazione corrente.
+        Il dizionario restituito può essere aggiornato con 'cpu' e 'maxrss' misurati altrove
+        e con altre informazioni da salvare insieme all'evento.
+        """
+        info = {}
+        input_sizes = _sizes(inputs)
+        start = time.time()
+        wall_start = time.perf_counter()
+        cpu_start = _cpu_time()
+        yield info
+        wall = time.perf_counter() - wall_start
+        if 'cpu' not in info:
+            info['cpu'] = _cpu_time() - cpu_start
+        if 'maxrss' not in info:
+            info['maxrss'] = _maxrss()
+            info['maxrss_scope'] = 'process'
+        event = {
+            'stage': name,
+            'iteration': self.iteration,
+            'pid': os.getpid(),
+            'start': start,
+            'wall': wall,
+            'inputs': input_sizes,
+            'outputs': _sizes(outputs),
+        }
+        event.update(info)
+        self.events.append(event)
+
+    def add_event(self, name, wall, start=None, **info):
+        """
+        Registra una fase misurata altrove, ad esempio l'avvio del container prima della pipeline.
+
+        :param wall: Durata in secondi.
+        :param start: Inizio come timestamp, di default wall secondi fa.
+        """
+        event = {
+            'stage': name,
+            'iteration': self.iteration,
+            'pid': os.getpid(),
+            'start': start if start is not None else time.time() - wall,
+            'wall': wall,
+            'inputs': {},
+            'outputs': {},
+            'cpu': 0.0,
+            'maxrss': 0,
+        }
+        event.update(info)
+        self.events.append(event)
+
+    def merge(self, events):
+        """ Aggiunge gli eventi registrati da un altro processo """
+        self.events.extend(events)
+
+    def save(self, json_path, trace_path=None):
+        """
+        Salva gli eventi in JSON e, se richiesto, in formato Chrome trace (chrome://tracing, Perfetto).
+        """
+        with open(json_path, 'w') as file:
+            json.dump(self.events, file, indent=1)
+        if trace_path is None:
+            return
+        trace = []
+        for event in self.events:
+            args = dict((key, value) for key, value in event.items() if key not in ('stage', 'start', 'wall', 'pid'))
+            trace.append({
+                'name': event['stage'],
+                'ph': 'X',
+                'ts': event['start'] * 1e6,
+                'dur': event['wall'] * 1e6,
+                'pid': event['pid'],
+                'tid': event['iteration'] if event['iteration'] is not None else 0,
+                'args': args,
+            })
+        with open(trace_path, 'w') as file:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, file)
+
+    def summary(self):
+        """ Tabella riassuntiva per fase, nell'ordine di prima esecuzione """
+        stages = {}
+        for event in self.events:
+            stats = stages.setdefault(event['stage'], {'count': 0, 'cached': 0, 'wall': 0.0, 'cpu': 0.0, 'maxrss': 0,
+                                                       'process': False})
+            stats['count'] += 1
+            stats['cached'] += 1 if event.get('cached') else 0
+            stats['wall'] += event['wall']
+            stats['cpu'] += event['cpu']
+            stats['maxrss'] = max(stats['maxrss'], event['maxrss'])
+            stats['process'] = stats['process'] or (event.get('maxrss_scope', 'process') == 'process' and event['maxrss'] > 0)
+        lines = ['%-16s %6s %6s %10s %10s %10s %10s' % ('stage', 'runs', 'cached', 'wall [s]', 'mean [s]', 'cpu [s]', 'rss [MB]')]
+        for stage, stats in stages.items():
+            lines.append('%-16s %6d %6d %10.2f %10.2f %10.2f %10.1f%s' % (
+                stage, stats['count'], stats['cached'], stats['wall'], stats['wall'] / stats['count'],
+                stats['cpu'], stats['maxrss'] / 1024.0, '*' if stats['process'] else ''))
+        if any(stats['process'] for stats in stages.values()):
+            lines.append('* picco di memoria del processo, non della sola fase')
+        return '\n'.join(lines)
@@ -0,0 +1,228 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import argparse
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    log_type TEXT NOT NULL,
+    run TEXT NOT NULL,
+    started REAL,
+    seed TEXT,
+    params TEXT,
+    UNIQUE (log_type, run)
+);
+CREATE TABLE IF NOT EXISTS scores (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    iteration INTEGER NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (run_id, iteration)
+);
+CREATE TABLE IF NOT EXISTS pairs (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    iteration INTEGER NOT NULL,
+    old_word TEXT NOT NULL,
+    new_word TEXT NOT NULL,
+    score REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pairs_iteration ON pairs (run_id, iteration);
+CREATE INDEX IF NOT EXISTS pairs_old_word ON pairs (old_word);
+"""
+
+def find_databases(source_dir, file_name='results.db'):
+    """ Percorsi ordinati dei database chiamati file_name in source_dir e nelle sue sottocartelle """
+    found = []
+    for root, dirs, files in os.walk(source_dir):
+        if file_name in files:
+            found.append(os.path.join(root, file_name))
+    return sorted(found)
+
+def log_type(run_name):
+    """ Tipo di log di un'esecuzione, ad esempio K8s_scheduler per K8s_scheduler_3 """
+    return re.sub(r'_\d+$', '', run_name)
+
+class ResultsStore(object):
+    """
+    Archivio SQLite dei risultati: esecuzioni (tipo di log, nome), punteggio medio di ogni iterazione
+    e punteggio di ogni coppia (parola, parola OOV).
+    La connessione viene aperta da ogni processo al primo uso, così l'oggetto può essere passato
+    ai processi del pool; le scritture concorrenti sono serializzate da SQLite.
+
+    :param path: File del database, creato se non esiste.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._conn = None
+        self._pid = None
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    @property
+    def conn(self):
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=60)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SCHEMA)
+            self._pid = os.getpid()
+        return self._conn
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def add_run(self, log_type, run, seed=None, params=None):
+        """
+        Registra un'esecuzione, o restituisce quella già registrata con lo stesso tipo di log e nome.
+
+        :return: Identificativo dell'esecuzione.
+        """
+        with self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO runs (log_type, run, started, seed, params) VALUES (?, ?, ?, ?, ?)',
+                              (log_type, run, time.time(), None if seed is None else str(seed),
+                               json.dumps(params, sort_keys=True) if params is not None else None))
+        return self.conn.execute('SELECT id FROM runs WHERE log_type = ? AND run = ?', (log_type, run)).fetchone()[0]
+
+    def record_iteration(self, run_id, iteration, score, pairs=None):
+        """
+        Salva il punteggio medio di un'iterazione e, se indicati, i punteggi delle coppie,
+        sostituendo quelli di un eventuale salvataggio precedente della stessa iterazione.
+
+        :param pairs: Lista di tuple (parola, parola OOV, punteggio).
+        """
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO scores (run_id, iteration, score) VALUES (?, ?, ?)',
+                              (run_id, iteration, score))
+            if pairs is not None:
+                self.conn.execute('DELETE FROM pairs WHERE run_id = ? AND iteration = ?', (run_id, iteration))
+                self.conn.executemany('INSERT INTO pairs (run_id, iteration, old_word, new_word, score) VALUES (?, ?, ?, ?, ?)',
+                                      ((run_id, iteration, old, new, value) for old, new, value in pairs))
+
+    def _select_runs(self, log_types=None, last=None):
+        # Clausola SQL e parametri per le esecuzioni dei tipi di log indicati, limitate alle ultime last per tipo
+        clauses = []
+        params = []
+        if log_types:
+            clauses.append('r.log_type IN (%s)' % ', '.join('?' * len(log_types)))
+            params.extend(log_types)
+        if last:
+            clauses.append('(SELECT COUNT(*) FROM runs n WHERE n.log_type = r.log_type AND n.started > r.started) < ?')
+            params.append(last)
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def fetch_scores(self, source='score', log_types=None, last=None):
+        """
+        Punteggi salvati, con il tipo di log e l'esecuzione di ognuno.
+
+        :param source: 'score' per i punteggi delle iterazioni, 'result' per quelli delle coppie.
+        :param log_types: Tipi di log da includere, tutti se None.
+        :param last: Numero di esecuzioni più recenti da considerare per ogni tipo di log.
+        :return: Cursore di tuple (tipo di log, esecuzione, punteggio).
+        """
+        table = 'scores' if source == 'score' else 'pairs'
+        where, params = self._select_runs(log_types, last)
+        return self.conn.execute('SELECT r.log_type, r.run, s.score FROM %s s JOIN runs r ON r.id = s.run_id%s '
+                                 'ORDER BY r.log_type, r.run, s.iteration' % (table, where), params)
+
+    def merge(self, other_path, run_suffix=''):
+        """
+        Copia nel database le esecuzioni di un altro database, sostituendo quelle con lo stesso nome.
+
+        :param run_suffix: Aggiunto al nome delle esecuzioni copiate, ad esempio per distinguere le ripetizioni.
+        :return: Numero di esecuzioni copiate.
+        """
+        other = ResultsStore(other_path)
+        merged = 0
+        for log_type, run, started, seed, params, old_id in other.conn.execute(
+                'SELECT log_type, run, started, seed, params, id FROM runs').fetchall():
+            run += run_suffix
+            merged += 1
+            with self.conn:
+                existing = self.conn.execute('SELECT id FROM runs WHERE log_type = ? AND run = ?', (log_type, run)).fetchone()
+                if existing:
+                    self.conn.execute('DELETE FROM scores WHERE run_id = ?', existing)
+                    self.conn.execute('DELETE FROM pairs WHERE run_id = ?', existing)
+                    self.conn.execute('DELETE FROM runs WHERE id = ?', existing)
+                run_id = self.conn.execute('INSERT INTO runs (log_type, run, started, seed, params) VALUES (?, ?, ?, ?, ?)',
+                                           (log_type, run, started, seed, params)).lastrowid
+                self.conn.executemany('INSERT INTO scores (run_id, iteration, score) VALUES (?, ?, ?)',
+                                      ((run_id,) + row for row in other.conn.execute(
+                                          'SELECT iteration, score FROM scores WHERE run_id = ?', (old_id,))))
+                self.conn.executemany('INSERT INTO pairs (run_id, iteration, old_word, new_word, score) VALUES (?, ?, ?, ?, ?)',
+                                      ((run_id,) + row for row in other.conn.execute(
+                                          'SELECT iteration, old_word, new_word, score FROM pairs WHERE run_id = ?', (old_id,))))
+        other.close()
+        return merged
+
+    def import_tree(self, source_dir):
+        """
+        Importa i risultati testuali già prodotti (score/score e score/result.txt) da una directory di risultati:
+        ogni sottocartella di primo livello è un'esecuzione, le cartelle iteration_N indicano l'iterazione.
+
+        :return: Numero di iterazioni importate.
+        """
+        imported = 0
+        for root, dirs, files in sorted(os.walk(source_dir)):
+            if os.path.basename(root) != 'score' or 'score' not in files:
+                continue
+            parts = os.path.relpath(root, source_dir).split(os.sep)
+            run = parts[0] if len(parts) > 1 else os.path.basename(os.path.normpath(source_dir))
+            iteration = next((int(part.split('_')[1]) for part in parts if re.match(r'iteration_\d+$', part)), 1)
+            with open(os.path.join(root, 'score')) as file:
+                score = float(file.read().split(':')[1])
+            pairs = None
+            if 'result.txt' in files:
+                with open(os.path.join(root, 'result.txt')) as file:
+                    pairs = [(old, new, float(value)) for old, new, value in
+                             (line.split() for line in file if len(line.split()) == 3)]
+            self.record_iteration(self.add_run(log_type(run), run), iteration, score, pairs)
+            imported += 1
+        return imported
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Archivio SQLite dei punteggi di tutte le esecuzioni.')
+    subparsers = parser.add_subparsers(dest='command')
+    merge = subparsers.add_parser('merge', help='merge the databases of single runs into one')
+    merge.add_argument('-o', help='output database', required=True)
+    merge.add_argument('databases', nargs='+', help='databases to merge; directories are searched for results.db files')
+    importer = subparsers.add_parser('import', help='import score/score and score/result.txt files of a results directory')
+    importer.add_argument('-o', help='output database', required=True)
+    importer.add_argument('source_dir', help='results directory')
+    query = subparsers.add_parser('query', help='run an SQL query, e.g. mean score per old word')
+    query.add_argument('-db', help='database', required=True)
+    query.add_argument('sql', help='SQL query on the runs, scores and pairs tables')
+    args = parser.parse_args()
+
+    if args.command == 'merge':
+        with ResultsStore(args.o) as store:
+            databases = []
+            for source in args.databases:
+                databases.extend(find_databases(source) if os.path.isdir(source) else [source])
+            databases = [database for database in databases if os.path.abspath(database) != store.path]
+            merged = sum(store.merge(database) for database in databases)
+            print(f'{merged} runs from {len(databases)} databases merged into {store.path}', flush=True)
+    elif args.command == 'import':
+        with ResultsStore(args.o) as store:
+            print(f'{store.import_tree(args.source_dir)} iterations imported', flush=True)
+    elif args.command == 'query':
+        with ResultsStore(args.db) as store:
+            cursor = store.conn.execute(args.sql)
+            print('\t'.join(column[0] for column in cursor.description or ()))
+            for row in cursor:
+                print('\t'.join(str(value) for value in row))
+    else:
+        parser.print_help()
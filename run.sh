@@ -1,54 +1,44 @@
 #!/bin/bash
 
-# Nome dello script che vuoi eseguire ripetutamente
-TARGET_SCRIPT="./run_docker.sh"
-LOG_PROCESS="K8s_scheduler.log"
+# Driver che esegue tutti i file di log con un unico limite di container contemporanei
+TARGET_SCRIPT="./run_all.py"
 
-# Numero di volte che lo script deve essere eseguito
+# File di log da confrontare, nella cartella ./logs/process_log
+LOG_FILES=("K8s_apiserver.log" "K8s_controller.log" "K8s_scheduler.log")
+
+# Numero di ripetizioni per ogni file di log
 NUM_RUNS=5
 
-# Estrarre il nome base del file di log (ad esempio LOG_PROCESS_<nome_log>)
-LOG_BASENAME=$(basename "$LOG_PROCESS" .log)
+# Numero di container per ogni ripetizione
+TOTAL_CONTAINERS=10
+
+# Numero massimo di container in esecuzione contemporaneamente, per tutti i file di log
+MAX_PARALLEL=5
 
-# Cartella di destinazione per i file rinominati
-DESTINATION_DIR="/Users/ludovicovitiello/Desktop/Tesi/Risultati_2/$LOG_BASENAME"
-#DESTINATION_DIR="/data/users/ludovico/Risultati/$LOG_BASENAME"
+# Cartella di destinazione: uno zip per log e ripetizione in $DESTINATION_DIR/<log>/<log>_<n>.zip
+DESTINATION_DIR="/Users/ludovicovitiello/Desktop/Tesi/Risultati_2"
+#DESTINATION_DIR="/data/users/ludovico/Risultati"
 
 # Crea la cartella di destinazione se non esiste
 mkdir -p "$DESTINATION_DIR"
 
-# Loop per eseguire lo script 5 volte
-for ((i=1; i<=NUM_RUNS; i++))
-do
-    echo "Esecuzione numero $i..."
-    
-    # Esegui lo script target e aspetta che finisca
-    bash "$TARGET_SCRIPT" "$LOG_PROCESS"
-    
-    # Controlla il codice di uscita per assicurarsi che lo script abbia completato correttamente
-    if [ $? -ne 0 ]; then
-        echo "Errore durante l'esecuzione dello script al tentativo numero $i."
-        exit 1
-    fi
-
-    echo "Completato esecuzione numero $i."
-    
-    # Trova il file .zip nella cartella ./logs
-    ZIP_FILE=$(find ./logs -maxdepth 1 -name "*.zip" -print -quit)
-    
-    # Verifica se un file .zip è stato trovato
-    if [ -n "$ZIP_FILE" ]; then
-        # Crea un nuovo nome per il file zip basato sul nome del file di log e il numero del ciclo
-        NEW_ZIP_FILE="${LOG_BASENAME}_$i.zip"
-        
-        # Rinomina e sposta il file nella cartella di destinazione
-        mv "$ZIP_FILE" "$DESTINATION_DIR/$NEW_ZIP_FILE"
-        
-        echo "File zip rinominato e spostato a $DESTINATION_DIR/$NEW_ZIP_FILE."
-    else
-        echo "Nessun file .zip trovato nella cartella ./logs dopo l'esecuzione numero $i."
-    fi
-
-done
-
-echo "Tutte le esecuzioni ($NUM_RUNS) sono state completate."
+echo "Esecuzione di ${#LOG_FILES[@]} file di log, $NUM_RUNS ripetizioni ciascuno..."
+
+# I container dei diversi log e ripetizioni si alternano negli stessi MAX_PARALLEL posti
+python "$TARGET_SCRIPT" "${LOG_FILES[@]}" \
+    --repetitions "$NUM_RUNS" \
+    --containers "$TOTAL_CONTAINERS" \
+    --slots "$MAX_PARALLEL" \
+    --timeout 600 \
+    --retries 1 \
+    --host-log-dir ./logs \
+    --cache-dir ./cache \
+    --destination "$DESTINATION_DIR"
+
+# Controlla il codice di uscita per assicurarsi che tutte le esecuzioni siano state completate
+if [ $? -ne 0 ]; then
+    echo "Errore: una o più esecuzioni non sono state completate, vedi $DESTINATION_DIR."
+    exit 1
+fi
+
+echo "Tutte le esecuzioni ($NUM_RUNS per ogni file di log) sono state completate."
@@ -0,0 +1,201 @@
+import os
+import sys
+import shutil
+import argparse
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import archive
+import results_store
+from scheduler import Job, DockerRunner, LocalRunner, run_jobs
+
+# Configurazione del logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CDF_SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plot_cdf.py')
+
+class Group(object):
+    """
+    Le esecuzioni di un file di log in una ripetizione, con una propria directory montata in /logs:
+    i container scrivono lì risultati, log e file intermedi, separati da quelli degli altri gruppi.
+
+    :param log_file: Nome del file di log nella directory di input.
+    :param repetition: Numero della ripetizione, a partire da 1.
+    :param runs_dir: Directory che contiene le directory di tutti i gruppi.
+    :param containers: Numero di esecuzioni del gruppo.
+    """
+
+    def __init__(self, log_file, repetition, runs_dir, containers):
+        self.log_file = log_file
+        self.repetition = repetition
+        self.base_name = os.path.splitext(log_file)[0]
+        self.directory = os.path.join(runs_dir, self.base_name, f'repetition_{repetition}')
+        self.containers = containers
+        self.results = []
+
+    @property
+    def key(self):
+        return (self.log_file, self.repetition)
+
+    @property
+    def name(self):
+        return f'{self.base_name} #{self.repetition}'
+
+    def jobs(self):
+        """ Job del gruppo, con i nomi usati da run_docker.sh; REPETITION indica il gruppo del job """
+        return [Job(self.log_file, f'{self.base_name}_{i + 1}', env={'REPETITION': str(self.repetition)})
+                for i in range(self.containers)]
+
+class BatchRunner(object):
+    """ Inoltra ogni job al runner del suo gruppo (file di log, ripetizione) """
+
+    def __init__(self, runners):
+        self.runners = runners
+
+    def _runner(self, job):
+        return self.runners[(job.log_file, int(job.env['REPETITION']))]
+
+    def start(self, job):
+        return self._runner(job).start(job)
+
+    def stop(self, job, process):
+        self._runner(job).stop(job, process)
+
+def interleave(groups, sizes):
+    """
+    Ordine di avvio dei job: una ripetizione alla volta, alternando i file di log dal più grande,
+    così i posti liberi vengono occupati da job di log diversi e i gruppi si completano presto.
+
+    :param sizes: Dizionario file di log -> dimensione in byte.
+    """
+    jobs = []
+    for repetition in sorted(set(group.repetition for group in groups)):
+        ordered = sorted((group for group in groups if group.repetition == repetition), key=lambda group: -sizes[group.log_file])
+        group_jobs = [group.jobs() for group in ordered]
+        for i in range(max(len(each) for each in group_jobs)):
+            jobs.extend(each[i] for each in group_jobs if i < len(each))
+    return jobs
+
+def plot_cdf(source_dir, output_dir, compare=()):
+    """ Esegue plot_cdf.py su source_dir salvando all_scores.txt e cdf_plot.png in output_dir """
+    command = [sys.executable, CDF_SCRIPT_PATH, source_dir, os.path.join(output_dir, 'all_scores.txt'),
+               os.path.join(output_dir, 'cdf_plot.png')]
+    if compare:
+        command += ['--compare'] + list(compare)
+    if subprocess.call(command) != 0:
+        logging.warning(f"Calcolo della CDF di {source_dir} non riuscito")
+
+def merge_results(group, database):
+    """
+    Unisce in database i results.db delle esecuzioni completate del gruppo; i nomi delle esecuzioni
+    ricevono il numero della ripetizione, perché si ripetono uguali in ogni gruppo dello stesso log.
+
+    :return: Numero di esecuzioni unite.
+    """
+    databases = results_store.find_databases(os.path.join(group.directory, 'results'))
+    with results_store.ResultsStore(database) as store:
+        return sum(store.merge(path, f' #{group.repetition}') for path in databases)
+
+def finalize_group(group, destination):
+    """
+    CDF dei punteggi e archivio di un gruppo completato, salvato in destination/<log>/<log>_<ripetizione>.zip;
+    i punteggi delle sue esecuzioni vengono uniti in destination/results.db.
+
+    :return: Percorso dell'archivio.
+    """
+    results_dir = os.path.join(group.directory, 'results')
+    if os.path.isdir(results_dir):
+        plot_cdf(results_dir, results_dir)
+    output = os.path.join(destination, group.base_name, f'{group.base_name}_{group.repetition}.zip')
+    if not os.path.exists(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+    stats = archive.build_archive(group.directory, output)
+    logging.info(f"{group.name}: archivio {output} ({stats['files']} file, {stats['size']} byte)")
+    merged = merge_results(group, os.path.join(destination, 'results.db'))
+    logging.info(f"{group.name}: {merged} esecuzioni unite in {os.path.join(destination, 'results.db')}")
+    return output
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Esegue più file di log e ripetizioni con un unico limite di esecuzioni contemporanee.')
+    parser.add_argument('log_files', nargs='+', help='File di log nella directory di input (process_log).')
+    parser.add_argument('--repetitions', type=int, default=5, help='Ripetizioni per ogni file di log.')
+    parser.add_argument('--containers', type=int, default=10, help='Esecuzioni della pipeline per ogni ripetizione.')
+    parser.add_argument('--slots', type=int, default=5, help='Numero massimo di esecuzioni contemporanee, per tutti i log.')
+    parser.add_argument('--timeout', type=float, default=600, help='Timeout in secondi di ogni esecuzione.')
+    parser.add_argument('--retries', type=int, default=1, help='Tentativi aggiuntivi per le esecuzioni fallite.')
+    parser.add_argument('--host-log-dir', type=str, default='./logs', help='Directory dei log; i gruppi vengono eseguiti in <dir>/runs.')
+    parser.add_argument('--input-dir', type=str, default=None, help='Directory dei file di log, di default <host-log-dir>/process_log.')
+    parser.add_argument('--destination', type=str, default='./results', help='Directory degli archivi, uno per log e ripetizione.')
+    parser.add_argument('--image', type=str, default='log2vec_docker', help='Immagine Docker da eseguire.')
+    parser.add_argument('--container-prefix', type=str, default='log2vec_container', help='Prefisso dei nomi dei container.')
+    parser.add_argument('--cache-dir', type=str, default='./cache', help='Cache condivisa dai container, montata in /cache.')
+    parser.add_argument('--local-command', type=str, default=None,
+                        help='Esegue i job con questo comando locale invece che con Docker; '
+                             'oltre ai segnaposto di scheduler.py accetta {group_dir}.')
+    args = parser.parse_args()
+
+    input_dir = os.path.abspath(args.input_dir or os.path.join(args.host_log_dir, 'process_log'))
+    missing = [log_file for log_file in args.log_files if not os.path.isfile(os.path.join(input_dir, log_file))]
+    if missing:
+        logging.error(f"File di log non trovati in {input_dir}: {', '.join(missing)}")
+        raise SystemExit(1)
+    sizes = dict((log_file, os.path.getsize(os.path.join(input_dir, log_file))) for log_file in args.log_files)
+
+    # Ogni gruppo riparte da una directory vuota, come con clean_logs in run_docker.sh
+    runs_dir = os.path.abspath(os.path.join(args.host_log_dir, 'runs'))
+    destination = os.path.abspath(args.destination)
+    groups = [Group(log_file, repetition + 1, runs_dir, args.containers)
+              for log_file in args.log_files for repetition in range(args.repetitions)]
+    for base_name in set(group.base_name for group in groups):
+        shutil.rmtree(os.path.join(runs_dir, base_name), ignore_errors=True)
+    runners = {}
+    for group in groups:
+        os.makedirs(os.path.join(group.directory, 'container_log'))
+        if args.local_command:
+            runners[group.key] = LocalRunner(args.local_command.replace('{group_dir}', group.directory))
+        else:
+            runners[group.key] = DockerRunner(args.image, group.directory, f'{args.container_prefix}_r{group.repetition}',
+                                              cache_dir=args.cache_dir, input_dir=input_dir)
+    if not args.local_command:
+        logging.info(f"Risorse condivise pronte in {runners[groups[0].key].warm_up():.1f} secondi")
+
+    # CDF e archivio di un gruppo vengono preparati appena le sue esecuzioni terminano, mentre le altre continuano
+    by_key = dict((group.key, group) for group in groups)
+    archives = {}
+    with ThreadPoolExecutor(max_workers=2) as finalizer:
+        def on_result(result):
+            group = by_key[(result.job.log_file, int(result.job.env['REPETITION']))]
+            group.results.append(result)
+            if len(group.results) == group.containers:
+                logging.info(f"{group.name} completato")
+                archives[group.key] = finalizer.submit(finalize_group, group, destination)
+
+        jobs = interleave(groups, sizes)
+        logging.info(f"{len(jobs)} esecuzioni di {len(args.log_files)} file di log, al massimo {args.slots} alla volta")
+        run_jobs(jobs, BatchRunner(runners), args.slots, args.timeout, args.retries, on_result)
+
+    # CDF di tutte le ripetizioni di ogni log e confronto tra i log
+    log_dirs = []
+    for log_file in args.log_files:
+        base_name = os.path.splitext(log_file)[0]
+        output_dir = os.path.join(destination, base_name)
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        plot_cdf(os.path.join(runs_dir, base_name), output_dir)
+        log_dirs.append(os.path.join(runs_dir, base_name))
+    if len(log_dirs) > 1:
+        plot_cdf(log_dirs[0], destination, log_dirs[1:])
+
+    failed = 0
+    for group in groups:
+        ok = sum(result.status == 'ok' for result in group.results)
+        failed += len(group.results) - ok
+        try:
+            path = archives[group.key].result()
+        except Exception as e:
+            path = f'archivio non creato: {e}'
+        logging.info(f"{group.name}: {ok}/{group.containers} esecuzioni completate, {path}")
+    if failed:
+        logging.error(f"{failed} esecuzioni non completate")
+        raise SystemExit(1)
+    logging.info(f"Tutte le {len(groups) * args.containers} esecuzioni sono state completate.")
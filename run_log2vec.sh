@@ -1,5 +1,62 @@
 #!/bin/bash
 
+# Istante di avvio del container, usato dalla pipeline per misurare il tempo di avvio
+export LOG2VEC_CONTAINER_START=$(date +%s.%N)
+
+# Directory condivisa da tutti i container dell'host (volume /cache): binari di lrcwe per hash dei sorgenti
+CACHE_DIR="/cache"
+LRCWE_SRC="/Log2Vec/code/LRWE/src"
+
+# Secondi trascorsi dall'avvio del container
+elapsed() {
+  awk -v start="$LOG2VEC_CONTAINER_START" -v now="$(date +%s.%N)" 'BEGIN { printf "%.2f", now - start }'
+}
+
+# Hash dei sorgenti di lrcwe: il binario viene ricompilato solo se cambiano
+lrcwe_source_hash() {
+  find "$LRCWE_SRC" -maxdepth 1 -type f \( -name '*.c' -o -name '*.h' -o -iname 'makefile' \) | sort | xargs cat | sha256sum | cut -d' ' -f1
+}
+
+build_lrcwe() {
+  (cd "$LRCWE_SRC" && make clean && make)
+}
+
+# Prepara il binario di lrcwe: quello dell'immagine se compilato dagli stessi sorgenti,
+# altrimenti quello nella cache dell'host, compilato una sola volta per tutti i container
+ensure_lrcwe() {
+  local hash
+  hash=$(lrcwe_source_hash)
+  if [ -x "$LRCWE_SRC/lrcwe" ] && [ "$(cat "$LRCWE_SRC/lrcwe.sha256" 2>/dev/null)" = "$hash" ]; then
+    echo "lrcwe già compilato per i sorgenti $hash."
+    return 0
+  fi
+  if [ -d "$CACHE_DIR" ] && [ -w "$CACHE_DIR" ]; then
+    local cached="$CACHE_DIR/lrcwe/$hash/lrcwe"
+    mkdir -p "$CACHE_DIR/lrcwe/$hash" || return 1
+    # il lock evita che più container compilino gli stessi sorgenti contemporaneamente
+    (
+      flock 9
+      if [ ! -x "$cached" ]; then
+        build_lrcwe && cp "$LRCWE_SRC/lrcwe" "$cached.tmp$$" && mv "$cached.tmp$$" "$cached"
+      fi
+    ) 9>"$CACHE_DIR/lrcwe/$hash.lock" || return 1
+    cp "$cached" "$LRCWE_SRC/lrcwe" || return 1
+    echo "lrcwe preso dalla cache $CACHE_DIR per i sorgenti $hash."
+  else
+    build_lrcwe || return 1
+  fi
+  echo "$hash" > "$LRCWE_SRC/lrcwe.sha256"
+}
+
+# Con WARM_ONLY=1 vengono solo preparate le risorse condivise (binario di lrcwe, file dei modelli
+# nella page cache dell'host); usato durante il build dell'immagine e da scheduler.py una volta per host
+if [ "$WARM_ONLY" = "1" ]; then
+  ensure_lrcwe || exit 1
+  cd /Log2Vec && python -c "import stage_runner as r; r.preload(r.DEFAULT_PRELOAD, r.DEFAULT_SPACY_MODELS, r.DEFAULT_NLTK_CORPORA)" || exit 1
+  echo "Risorse pronte in $(elapsed) secondi."
+  exit 0
+fi
+
 # Nome del file di log
 LOG_FILE_PATH="/logs/container_log/$CONTAINER_NAME.log"
 
@@ -14,9 +71,13 @@ if [ -z "$BASE_NAME" ]; then
   exit 1
 fi
 
-# Definisci i percorsi
-SOURCE_PATH="/logs/process_log/$LOG_FILE"
-DESTINATION_PATH="/Log2Vec/data/$BASE_NAME.log"
+# Il log viene letto direttamente dal volume /input, montato in sola lettura, senza copiarlo;
+# senza quel volume si legge dalla cartella process_log del volume /logs
+INPUT_DIR="/input"
+if [ ! -d "$INPUT_DIR" ]; then
+  INPUT_DIR="/logs/process_log"
+fi
+SOURCE_PATH="$INPUT_DIR/$LOG_FILE"
 
 # Verifica se il file sorgente esiste
 if [ ! -f "$SOURCE_PATH" ]; then
@@ -24,58 +85,49 @@ if [ ! -f "$SOURCE_PATH" ]; then
   exit 1
 fi
 
-# Copia il file nella destinazione
-cp "$SOURCE_PATH" "/Log2Vec/data/"
-if [ $? -ne 0 ]; then
-  echo "Errore durante la copia del file $SOURCE_PATH." | tee -a "$LOG_FILE_PATH"
-  exit 1
-fi
-
-# Rinomina il file nella destinazione
-mv "/Log2Vec/data/$LOG_FILE" "$DESTINATION_PATH"
-if [ $? -ne 0 ]; then
-  echo "Errore durante la rinomina del file in $DESTINATION_PATH." | tee -a "$LOG_FILE_PATH"
-  exit 1
-fi
-
-echo "File copiato e rinominato con successo in $DESTINATION_PATH." | tee -a "$LOG_FILE_PATH"
-
 # Naviga nella directory principale del progetto
 cd /Log2Vec || { echo "Errore: Impossibile accedere alla directory /Log2Vec." | tee -a "$LOG_FILE_PATH"; exit 1; }
 
-# Naviga nella directory del codice
-cd code/LRWE/src || { echo "Errore: Impossibile accedere alla directory code/LRWE/src." | tee -a "$LOG_FILE_PATH"; exit 1; }
-
-# Pulisci la compilazione precedente
-make clean
-if [ $? -ne 0 ]; then
-  echo "Errore durante la pulizia del progetto." | tee -a "$LOG_FILE_PATH"
-  exit 1
-fi
-
-# Compila il codice
-make
-if [ $? -ne 0 ]; then
-  echo "Errore durante la compilazione del progetto." | tee -a "$LOG_FILE_PATH"
+# Prepara lrcwe senza ricompilarlo se i sorgenti non sono cambiati
+ensure_lrcwe 2>&1 | tee -a "$LOG_FILE_PATH"
+if [ "${PIPESTATUS[0]}" -ne 0 ]; then
+  echo "Errore durante la compilazione di lrcwe." | tee -a "$LOG_FILE_PATH"
   exit 1
 fi
 
-# Torna alla directory principale del progetto
-cd /Log2Vec
+echo "Avvio del container completato in $(elapsed) secondi." | tee -a "$LOG_FILE_PATH"
+
+# Copia i punteggi, il profilo e il manifest di un'esecuzione fallita in /logs/failed: la directory di lavoro
+# resta per il nuovo tentativo ma non viene archiviata, perché contiene anche i file intermedi
+save_reports() {
+  local source="$WORK_DIR/$BASE_NAME" target="/logs/failed/$BASE_NAME"
+  [ -d "$source" ] || return 0
+  mkdir -p "$target"
+  for report in all_scores.txt profile.json profile.trace.json manifest.json results.db; do
+    [ -f "$source/$report" ] && cp "$source/$report" "$target/"
+  done
+  echo "Report dell'esecuzione fallita copiati in $target" | tee -a "$LOG_FILE_PATH"
+}
+
+# I risultati intermedi restano nel volume /logs: se il container viene fermato,
+# il nuovo tentativo dello scheduler riprende dalla prima fase non completata
+WORK_DIR="/logs/work/$BASE_NAME"
+mkdir -p "$WORK_DIR"
 
 # Esegui il pipeline.py con il file di log specificato
-python pipeline.py -i "$DESTINATION_PATH" -t "$BASE_NAME" -o /Log2Vec/results | tee -a "$LOG_FILE_PATH"
+# PIPELINE_ARGS può aggiungere opzioni, ad esempio -e PIPELINE_ARGS="--stage-budget mimick=120"
+python pipeline.py -i "$SOURCE_PATH" -t "$BASE_NAME" -o "$WORK_DIR" --resume $PIPELINE_ARGS | tee -a "$LOG_FILE_PATH"
 
-# Verifica il successo dell'esecuzione del comando python
-if [ $? -eq 0 ]; then
+# Verifica il successo dell'esecuzione del comando python (non di tee)
+if [ "${PIPESTATUS[0]}" -eq 0 ]; then
   echo "Processamento completato con successo per il file di log $LOG_FILE." | tee -a "$LOG_FILE_PATH"
   
   # Assicurati che la directory di destinazione esista
   mkdir -p /logs/results/$BASE_NAME
 
   # Sposta la cartella dei risultati
-  if [ -d "/Log2Vec/results/$BASE_NAME" ]; then
-    mv /Log2Vec/results/$BASE_NAME /logs/results/
+  if [ -d "$WORK_DIR/$BASE_NAME" ]; then
+    rm -rf "/logs/results/$BASE_NAME" "/logs/failed/$BASE_NAME" && mv "$WORK_DIR/$BASE_NAME" /logs/results/ && rm -rf "$WORK_DIR"
     if [ $? -eq 0 ]; then
       echo "Cartella $BASE_NAME spostata con successo in /logs/results/" | tee -a "$LOG_FILE_PATH"
     else
@@ -83,11 +135,12 @@ if [ $? -eq 0 ]; then
       exit 1
     fi
   else
-    echo "Errore: La cartella /Log2Vec/results/$BASE_NAME non esiste." | tee -a "$LOG_FILE_PATH"
+    echo "Errore: La cartella $WORK_DIR/$BASE_NAME non esiste." | tee -a "$LOG_FILE_PATH"
     exit 1
   fi
   
 else
   echo "Errore durante il processamento del file di log $LOG_FILE." | tee -a "$LOG_FILE_PATH"
+  save_reports
   exit 1
 fi
\ No newline at end of file
@@ -0,0 +1,211 @@
+import os
+import time
+import queue
+import shlex
+import argparse
+import logging
+import threading
+import subprocess
+from collections import deque
+
+# Configurazione del logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+class Job(object):
+    """
+    Un'esecuzione della pipeline su un file di log.
+
+    :param log_file: Nome del file di log in process_log.
+    :param run_name: Nome dell'esecuzione, usato come BASE_NAME nel container.
+    :param attempt: Numero del tentativo, a partire da 0.
+    :param env: Variabili d'ambiente aggiuntive per l'esecuzione.
+    """
+
+    def __init__(self, log_file, run_name, attempt=0, env=None):
+        self.log_file = log_file
+        self.run_name = run_name
+        self.attempt = attempt
+        self.env = env or {}
+
+    def retry(self):
+        """ Restituisce lo stesso job con il contatore dei tentativi incrementato """
+        return Job(self.log_file, self.run_name, self.attempt + 1, self.env)
+
+class JobResult(object):
+    """ Esito finale di un job: status è 'ok', 'failed' o 'timeout' """
+
+    def __init__(self, job, status, returncode, duration):
+        self.job = job
+        self.status = status
+        self.returncode = returncode
+        self.duration = duration
+
+class DockerRunner(object):
+    """
+    Esegue ogni job in un container log2vec_docker, in primo piano, così che la sua terminazione sia un evento.
+    I log di input (input_dir, di default process_log in host_log_dir) sono montati in sola lettura in /input
+    e cache_dir, condivisa da tutti i container, in /cache.
+    """
+
+    def __init__(self, image='log2vec_docker', host_log_dir='./logs', container_prefix='log2vec_container',
+                 platform='linux/amd64', cache_dir='./cache', input_dir=None):
+        self.image = image
+        self.host_log_dir = os.path.abspath(host_log_dir)
+        self.container_prefix = container_prefix
+        self.platform = platform
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.input_dir = os.path.abspath(input_dir or os.path.join(host_log_dir, 'process_log'))
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def volumes(self):
+        return ['-v', f'{self.host_log_dir}:/logs',
+                '-v', f'{self.input_dir}:/input:ro',
+                '-v', f'{self.cache_dir}:/cache']
+
+    def warm_up(self):
+        """
+        Prepara una sola volta per host le risorse condivise dai container: il binario di lrcwe in cache
+        e i file dei modelli nella page cache.
+
+        :return: Durata in secondi.
+        """
+        started = time.time()
+        returncode = subprocess.call(['docker', 'run', '--platform', self.platform, '--rm'] + self.volumes()
+                                     + ['-e', 'WARM_ONLY=1', self.image], stdout=subprocess.DEVNULL)
+        if returncode != 0:
+            logging.warning(f"Preparazione delle risorse condivise fallita (codice {returncode})")
+        return time.time() - started
+
+    def container_name(self, job):
+        return f'{self.container_prefix}_{job.run_name}'
+
+    def start(self, job):
+        name = self.container_name(job)
+        # un container rimasto da un tentativo precedente bloccherebbe il nome
+        subprocess.call(['docker', 'rm', '-f', name], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        command = (['docker', 'run', '--platform', self.platform, '--rm',
+                    '--name', name]
+                   + self.volumes()
+                   + ['-e', f'BASE_NAME={job.run_name}',
+                      '-e', f'LOG_FILE={job.log_file}',
+                      '-e', f'CONTAINER_NAME={name}'])
+        for key, value in job.env.items():
+            command += ['-e', f'{key}={value}']
+        command.append(self.image)
+        return subprocess.Popen(command, stdout=subprocess.DEVNULL)
+
+    def stop(self, job, process):
+        subprocess.call(['docker', 'kill', self.container_name(job)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        process.wait()
+
+class LocalRunner(object):
+    """
+    Esegue ogni job come sottoprocesso locale, ad esempio per provare lo scheduler senza Docker.
+    Il comando può contenere i segnaposto {log_file}, {run_name} e {attempt}.
+    """
+
+    def __init__(self, command):
+        self.command = shlex.split(command) if isinstance(command, str) else list(command)
+
+    def start(self, job):
+        command = [part.format(log_file=job.log_file, run_name=job.run_name, attempt=job.attempt)
+                   for part in self.command]
+        env = dict(os.environ)
+        env.update(job.env)
+        return subprocess.Popen(command, env=env)
+
+    def stop(self, job, process):
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+def _wait(runner, job, process, timeout, events):
+    # Attende la fine del job e notifica lo scheduler; allo scadere del timeout il job viene fermato
+    started = time.time()
+    try:
+        returncode = process.wait(timeout=timeout)
+        status = 'ok' if returncode == 0 else 'failed'
+    except subprocess.TimeoutExpired:
+        runner.stop(job, process)
+        returncode = process.returncode
+        status = 'timeout'
+    events.put((job, status, returncode, time.time() - started))
+
+def run_jobs(jobs, runner, slots, timeout=None, retries=0, on_result=None):
+    """
+    Esegue i job tenendo sempre occupati fino a slots posti: appena un job termina ne parte un altro.
+
+    :param jobs: Job da eseguire, nell'ordine di avvio.
+    :param runner: Oggetto con i metodi start(job) -> Popen e stop(job, process).
+    :param slots: Numero massimo di job in esecuzione contemporaneamente.
+    :param timeout: Tempo massimo in secondi per ogni tentativo di un job, None per nessun limite.
+    :param retries: Numero di tentativi aggiuntivi per i job falliti o scaduti.
+    :param on_result: Funzione chiamata con ogni JobResult appena il job termina definitivamente.
+    :return: Lista di JobResult, nell'ordine di completamento.
+    """
+    pending = deque(jobs)
+    events = queue.Queue()
+    running = 0
+    results = []
+    while pending or running:
+        while pending and running < slots:
+            job = pending.popleft()
+            logging.info(f"Avvio di {job.run_name} ({job.log_file}), tentativo {job.attempt + 1}")
+            process = runner.start(job)
+            thread = threading.Thread(target=_wait, args=(runner, job, process, timeout, events))
+            thread.daemon = True
+            thread.start()
+            running += 1
+
+        job, status, returncode, duration = events.get()
+        running -= 1
+        if status == 'ok':
+            logging.info(f"{job.run_name} completato in {duration:.0f} secondi")
+        elif job.attempt < retries:
+            logging.warning(f"{job.run_name} terminato con esito {status} (codice {returncode}), nuovo tentativo")
+            pending.append(job.retry())
+            continue
+        else:
+            logging.error(f"{job.run_name} terminato con esito {status} (codice {returncode})")
+        result = JobResult(job, status, returncode, duration)
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+    return results
+
+def iteration_jobs(log_file, total):
+    """ Job delle esecuzioni 1..total di un file di log, con i nomi usati da run_docker.sh """
+    base_name = os.path.splitext(log_file)[0]
+    return [Job(log_file, f'{base_name}_{i + 1}') for i in range(total)]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Esegue le iterazioni di Log2Vec tenendo sempre occupati N posti.')
+    parser.add_argument('log_file', type=str, help='Nome del file di log in process_log.')
+    parser.add_argument('--total', type=int, default=10, help='Numero totale di esecuzioni.')
+    parser.add_argument('--slots', type=int, default=5, help='Numero massimo di esecuzioni contemporanee.')
+    parser.add_argument('--timeout', type=float, default=None, help='Timeout in secondi di ogni esecuzione.')
+    parser.add_argument('--retries', type=int, default=0, help='Tentativi aggiuntivi per le esecuzioni fallite.')
+    parser.add_argument('--host-log-dir', type=str, default='./logs', help='Directory dei log montata in /logs.')
+    parser.add_argument('--image', type=str, default='log2vec_docker', help='Immagine Docker da eseguire.')
+    parser.add_argument('--container-prefix', type=str, default='log2vec_container', help='Prefisso dei nomi dei container.')
+    parser.add_argument('--cache-dir', type=str, default='./cache', help='Cache condivisa dai container, montata in /cache.')
+    parser.add_argument('--local-command', type=str, default=None,
+                        help='Esegue i job con questo comando locale invece che con Docker.')
+    args = parser.parse_args()
+
+    if args.local_command:
+        runner = LocalRunner(args.local_command)
+    else:
+        runner = DockerRunner(args.image, args.host_log_dir, args.container_prefix, cache_dir=args.cache_dir)
+        logging.info(f"Risorse condivise pronte in {runner.warm_up():.1f} secondi")
+
+    results = run_jobs(iteration_jobs(args.log_file, args.total), runner, args.slots, args.timeout, args.retries)
+    failed = [result.job.run_name for result in results if result.status != 'ok']
+    if failed:
+        logging.error(f"Esecuzioni non completate: {', '.join(failed)}")
+        raise SystemExit(1)
+    logging.info(f"Tutte le {len(results)} esecuzioni sono state completate.")
@@ -0,0 +1,135 @@
+import os
+import json
+import fcntl
+import shutil
+import hashlib
+
+def file_digest(path, block_size=1 << 20):
+    """
+    Calcola lo sha256 del contenuto di un file leggendolo a blocchi.
+
+    :param path: Percorso del file.
+    :param block_size: Dimensione dei blocchi letti.
+    :return: Digest esadecimale del contenuto.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class StageCache(object):
+    """
+    Cache degli output delle fasi della pipeline, indicizzata dal contenuto dei file di input
+    e dai parametri della fase. Gli output di una fase già eseguita con gli stessi input
+    vengono ricopiati dalla cache invece di rieseguire la fase.
+    """
+
+    def __init__(self, cache_dir, enabled=True):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.stats = {}
+        self._digests = {}
+        if enabled and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def digest(self, path):
+        """ Digest di un file, memorizzato finché dimensione e mtime non cambiano """
+        stat = os.stat(path)
+        signature = (stat.st_size, stat.st_mtime_ns)
+        cached = self._digests.get(path)
+        if cached is None or cached[0] != signature:
+            cached = (signature, file_digest(path))
+            self._digests[path] = cached
+        return cached[1]
+
+    def key(self, stage, inputs, params):
+        """
+        Chiave della fase: nome, parametri e contenuto dei file di input (non i loro percorsi).
+
+        :param stage: Nome della fase.
+        :param inputs: Dizionario nome logico -> percorso dei file di input.
+        :param params: Dizionario dei parametri della fase.
+        :return: Chiave esadecimale.
+        """
+        description = {
+            'stage': stage,
+            'params': params,
+            'inputs': dict((name, self.digest(path)) for name, path in inputs.items()),
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def run(self, stage, inputs, outputs, params, action):
+        """
+        Esegue la fase solo se i suoi output non sono già in cache.
+
+        :param stage: Nome della fase.
+        :param inputs: Dizionario nome logico -> percorso dei file di input.
+        :param outputs: Dizionario nome logico -> percorso dei file prodotti dalla fase.
+        :param params: Dizionario dei parametri della fase.
+        :param action: Funzione senza argomenti che esegue la fase e produce gli output.
+        :return: True se gli output sono stati presi dalla cache.
+        """
+        stats = self.stats.setdefault(stage, {'hit': 0, 'miss': 0})
+        if not self.enabled:
+            action()
+            stats['miss'] += 1
+            return False
+
+        entry = os.path.join(self.cache_dir, stage, self.key(stage, inputs, params))
+        if self._restore(entry, outputs):
+            stats['hit'] += 1
+            return True
+
+        # Processi che calcolano la stessa voce (ad esempio le prove di uno sweep) la attendono invece di ricalcolarla
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        with open(entry + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self._restore(entry, outputs):
+                stats['hit'] += 1
+                return True
+            self._compute(stage, entry, outputs, action)
+        stats['miss'] += 1
+        return False
+
+    def _restore(self, entry, outputs):
+        # Copia gli output dalla voce della cache, se completa
+        if not all(os.path.isfile(os.path.join(entry, name)) for name in outputs):
+            return False
+        for name, path in outputs.items():
+            shutil.copyfile(os.path.join(entry, name), path)
+        return True
+
+    def _compute(self, stage, entry, outputs, action):
+        action()
+        missing = [path for path in outputs.values() if not os.path.isfile(path)]
+        if missing:
+            # La fase non ha prodotto tutti gli output: non si salva nulla in cache
+            print('Fase %s: output mancanti %s, risultato non salvato in cache' % (stage, missing), flush=True)
+        else:
+            # Copia in una directory temporanea e rinomina, così una voce è sempre completa
+            tmp_entry = '%s.tmp%d' % (entry, os.getpid())
+            if os.path.exists(tmp_entry):
+                shutil.rmtree(tmp_entry)
+            os.makedirs(tmp_entry)
+            for name, path in outputs.items():
+                shutil.copyfile(path, os.path.join(tmp_entry, name))
+            try:
+                os.rename(tmp_entry, entry)
+            except OSError:
+                # Un altro processo ha già salvato la stessa voce
+                shutil.rmtree(tmp_entry)
+
+    def merge(self, stats):
+        """ Somma alle statistiche correnti quelle raccolte da un altro processo """
+        for stage, counts in stats.items():
+            current = self.stats.setdefault(stage, {'hit': 0, 'miss': 0})
+            current['hit'] += counts['hit']
+            current['miss'] += counts['miss']
+
+    def report(self):
+        """ Restituisce il riepilogo hit/miss per fase come testo """
+        lines = ['%-20s %6s %6s' % ('stage', 'hit', 'miss')]
+        for stage, stats in self.stats.items():
+            lines.append('%-20s %6d %6d' % (stage, stats['hit'], stats['miss']))
+        return '\n'.join(lines)
@@ -0,0 +1,82 @@
+import os
+import json
+import time
+
+class StageManifest(object):
+    """
+    Manifest delle fasi e delle iterazioni completate di un'esecuzione della pipeline, riscritto dopo ognuna.
+    Con --resume una nuova esecuzione salta le fasi i cui output esistono ancora invariati
+    e le iterazioni di cui è già noto il punteggio.
+
+    :param path: File del manifest; None per disattivarlo.
+    :param signature: Dizionario che identifica l'esecuzione (input e parametri): un manifest
+                      scritto con una firma diversa viene ignorato.
+    :param resume: Se False il manifest esistente viene ignorato e riscritto da zero.
+    """
+
+    def __init__(self, path=None, signature=None, resume=False):
+        self.path = path
+        self.data = {'signature': signature, 'stages': {}, 'iterations': {}}
+        self.resumed = False
+        if path is not None and resume and os.path.isfile(path):
+            try:
+                with open(path) as file:
+                    data = json.load(file)
+            except ValueError:
+                data = None
+            if data is not None and data.get('signature') == signature:
+                self.data = data
+                self.resumed = True
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def _outputs(self, outputs):
+        # Dimensione e data di modifica degli output, per riconoscere quelli cambiati o cancellati
+        state = {}
+        for path in outputs:
+            stat = os.stat(path)
+            state[os.path.abspath(path)] = [stat.st_size, stat.st_mtime_ns]
+        return state
+
+    def done(self, stage, outputs=()):
+        """ True se la fase è già stata completata e i suoi output non sono cambiati """
+        entry = self.data['stages'].get(stage)
+        if not self.enabled or entry is None:
+            return False
+        try:
+            return self._outputs(outputs) == entry['outputs']
+        except OSError:
+            return False
+
+    def complete(self, stage, outputs=()):
+        """ Registra la fase come completata con i suoi output """
+        if self.enabled:
+            self.data['stages'][stage] = {'outputs': self._outputs(outputs), 'time': time.time()}
+            self.save()
+
+    def score(self, iteration):
+        """ Punteggio di un'iterazione completata, None se non è ancora stata eseguita """
+        return self.data['iterations'].get(str(iteration))
+
+    def record_iteration(self, iteration, score):
+        if self.enabled:
+            self.data['iterations'][str(iteration)] = score
+            self.save()
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value):
+        """ Salva un valore dell'esecuzione, ad esempio il seed da riusare con --resume """
+        self.data[key] = value
+        if self.enabled:
+            self.save()
+
+    def save(self):
+        # Scrittura atomica: un'interruzione non lascia mai un manifest incompleto
+        tmp_path = '%s.tmp%d' % (self.path, os.getpid())
+        with open(tmp_path, 'w') as file:
+            json.dump(self.data, file, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
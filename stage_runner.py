@@ -0,0 +1,384 @@
+import os
+import sys
+import time
+import runpy
+import atexit
+import weakref
+import signal
+import threading
+import resource
+import subprocess
+import traceback
+import multiprocessing
+
+# Librerie importate una sola volta dal worker e condivise da tutte le fasi
+DEFAULT_PRELOAD = ('numpy', 'gensim', 'nltk', 'spacy')
+# Modelli spaCy e corpora NLTK caricati dal worker prima della prima fase
+DEFAULT_SPACY_MODELS = ('en_core_web_md',)
+DEFAULT_NLTK_CORPORA = ('wordnet',)
+# Secondi concessi a una fase fermata per terminare dopo SIGTERM, prima di SIGKILL
+STOP_GRACE = 10
+
+# Runner con un worker attivo, chiusi all'uscita dell'interprete se nessuno li ha chiusi prima
+_open_runners = weakref.WeakSet()
+_atexit_registered = False
+
+def _close_runners():
+    for runner in list(_open_runners):
+        runner.close()
+
+class StageError(RuntimeError):
+    """ Una fase della pipeline è terminata con un codice di uscita diverso da zero """
+
+    def __init__(self, command, returncode):
+        super(StageError, self).__init__('Il comando %s è terminato con codice %s' % (' '.join(command), returncode))
+        self.command = command
+        self.returncode = returncode
+
+    def __reduce__(self):
+        # Le eccezioni sollevate nei processi del pool vengono ricostruite nel processo padre
+        return (self.__class__, (self.command, self.returncode))
+
+class StageTimeout(StageError):
+    """ Una fase della pipeline ha superato il tempo a sua disposizione ed è stata fermata """
+
+    def __init__(self, command, timeout):
+        RuntimeError.__init__(self, 'Il comando %s ha superato il limite di %s secondi' % (' '.join(command), timeout))
+        self.command = command
+        self.returncode = None
+        self.timeout = timeout
+
+    def __reduce__(self):
+        return (self.__class__, (self.command, self.timeout))
+
+class _Expired(BaseException):
+    # Sollevata dal timer di una fase inline; non è una Exception, così execute_script non la intercetta
+    pass
+
+def _expire(signum, frame):
+    raise _Expired()
+
+def _memoize_loader(load):
+    """ Restituisce una versione di load che carica ogni modello una sola volta """
+    models = {}
+    def cached_load(name, *args, **kwargs):
+        if args or kwargs or not isinstance(name, str):
+            return load(name, *args, **kwargs)
+        if name not in models:
+            models[name] = load(name)
+        return models[name]
+    return cached_load
+
+def preload(modules, spacy_models=(), nltk_corpora=()):
+    """
+    Importa le librerie indicate e fa in modo che i modelli spaCy vengano caricati una sola volta.
+
+    :param modules: Nomi dei moduli da importare; quelli non installati vengono ignorati.
+    :param spacy_models: Modelli spaCy da caricare subito, così che la prima fase li trovi già in memoria.
+    :param nltk_corpora: Corpora NLTK da caricare subito.
+    """
+    for name in modules:
+        try:
+            __import__(name)
+        except ImportError:
+            continue
+    spacy = sys.modules.get('spacy')
+    if spacy is not None and not hasattr(spacy.load, '__wrapped_loader__'):
+        cached_load = _memoize_loader(spacy.load)
+        cached_load.__wrapped_loader__ = spacy.load
+        spacy.load = cached_load
+    for name in spacy_models if spacy is not None else ():
+        try:
+            spacy.load(name)
+        except (IOError, OSError):
+            continue
+    nltk = sys.modules.get('nltk')
+    for name in nltk_corpora if nltk is not None else ():
+        try:
+            getattr(nltk.corpus, name).ensure_loaded()
+        except (LookupError, AttributeError):
+            continue
+
+def _is_project_module(module, root):
+    path = getattr(module, '__file__', None)
+    return path is not None and os.path.abspath(path).startswith(root + os.sep)
+
+def execute_script(script, args):
+    """
+    Esegue uno script Python nel processo corrente come se fosse lanciato da riga di comando.
+    I moduli del progetto importati dallo script vengono dimenticati al termine, le librerie restano caricate.
+
+    :param script: Percorso dello script.
+    :param args: Argomenti da riga di comando.
+    :return: Codice di uscita dello script.
+    """
+    root = os.getcwd()
+    loaded = set(sys.modules)
+    saved_argv, saved_path = sys.argv, list(sys.path)
+    sys.argv = [script] + list(args)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    try:
+        runpy.run_path(script, run_name='__main__')
+        returncode = 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            returncode = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+            returncode = 1
+    except Exception:
+        traceback.print_exc()
+        returncode = 1
+    finally:
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+        for name, module in list(sys.modules.items()):
+            if name not in loaded and _is_project_module(module, root):
+                del sys.modules[name]
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return returncode
+
+def _cpu_time(usage):
+    return usage.ru_utime + usage.ru_stime
+
+def _reset_peak_rss():
+    """ Riporta il picco di memoria del processo (VmHWM) alla memoria attuale; False se non è possibile """
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        return False
+
+def _peak_rss():
+    """ Picco di memoria del processo in KB da /proc/self/status, None se non disponibile """
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def execute_measured(script, args):
+    """
+    Esegue uno script con execute_script misurando il tempo di CPU usato e il picco di memoria.
+    Prima della fase il picco del processo viene azzerato con /proc/self/clear_refs, così VmHWM misura
+    solo la fase; se non è possibile 'maxrss' è il picco del processo dal suo avvio e 'maxrss_scope'
+    vale 'process' invece di 'stage'. I sottoprocessi contano solo se superano il picco dei precedenti.
+
+    :return: Tuple (codice di uscita, dizionario con 'cpu' in secondi, 'maxrss' in KB e 'maxrss_scope').
+    """
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    stage_peak = _reset_peak_rss()
+    returncode = execute_script(script, args)
+    peak = _peak_rss() if stage_peak else None
+    self_after = resource.getrusage(resource.RUSAGE_SELF)
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (_cpu_time(self_after) - _cpu_time(self_before)
+           + _cpu_time(children_after) - _cpu_time(children_before))
+    if peak is None:
+        peak = self_after.ru_maxrss
+    # ru_maxrss dei figli è il massimo di tutti i figli terminati: è della fase solo se è cresciuto
+    if children_after.ru_maxrss > children_before.ru_maxrss:
+        peak = max(peak, children_after.ru_maxrss)
+    scope = 'stage' if stage_peak else 'process'
+    return returncode, {'cpu': cpu, 'maxrss': peak, 'maxrss_scope': scope}
+
+def _stop_process(process):
+    # SIGTERM, poi SIGKILL se il processo non termina entro STOP_GRACE secondi
+    process.terminate()
+    try:
+        process.wait(timeout=STOP_GRACE)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def call_measured(command, timeout=None):
+    """
+    Esegue un comando come sottoprocesso e ne legge l'uso di risorse con wait4.
+
+    :param timeout: Secondi dopo cui il comando viene fermato, None per nessun limite.
+    :return: Tuple (codice di uscita, dizionario con 'cpu' in secondi e 'maxrss' in KB).
+    :raises StageTimeout: Se il comando supera timeout.
+    """
+    process = subprocess.Popen(command)
+    if timeout is None:
+        _, status, usage = os.wait4(process.pid, 0)
+    else:
+        deadline = time.time() + timeout
+        while True:
+            pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                break
+            if time.time() >= deadline:
+                _stop_process(process)
+                raise StageTimeout(command, timeout)
+            time.sleep(min(0.1, max(deadline - time.time(), 0.01)))
+    if os.WIFSIGNALED(status):
+        returncode = -os.WTERMSIG(status)
+    else:
+        returncode = os.WEXITSTATUS(status)
+    process.returncode = returncode
+    return returncode, {'cpu': _cpu_time(usage), 'maxrss': usage.ru_maxrss, 'maxrss_scope': 'stage'}
+
+def _worker_loop(conn, modules, spacy_models, nltk_corpora):
+    # Ctrl-C e SIGTERM vengono gestiti dal processo padre, che chiude il worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    started = time.time()
+    preload(modules, spacy_models, nltk_corpora)
+    # il primo messaggio è il tempo di caricamento delle librerie e dei modelli
+    conn.send(time.time() - started)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        script, args, cwd = task
+        os.chdir(cwd)
+        conn.send(execute_measured(script, args))
+
+class StageRunner(object):
+    """
+    Esegue le fasi della pipeline. Gli script Python girano in un processo worker persistente
+    (mode='worker'), nel processo corrente (mode='inline') o in un nuovo interprete
+    (mode='subprocess'); i binari nativi come lrcwe girano sempre come sottoprocessi.
+    Solo il worker carica i modelli spaCy e i corpora NLTK prima della prima fase. In modalità inline,
+    usata dai processi del pool di pipeline.py e sweep.py, le librerie vengono importate subito ma i modelli
+    vengono caricati dalla prima fase che li usa, ad esempio syn_ant e triplet nei task di training di sweep.py;
+    spacy.load resta memoizzato, quindi ogni processo del pool carica ogni modello una sola volta.
+    """
+
+    def __init__(self, mode='worker', modules=DEFAULT_PRELOAD, spacy_models=DEFAULT_SPACY_MODELS,
+                 nltk_corpora=DEFAULT_NLTK_CORPORA):
+        if mode not in ('worker', 'inline', 'subprocess'):
+            raise ValueError('Modalità non valida: %s' % mode)
+        self.mode = mode
+        self.modules = modules
+        self.spacy_models = spacy_models
+        self.nltk_corpora = nltk_corpora
+        self.preload_time = None
+        self._process = None
+        self._conn = None
+        self._ready = False
+        self._busy = False
+        if mode == 'inline':
+            preload(modules)
+
+    def _start_worker(self):
+        global _atexit_registered
+        self._conn, child_conn = multiprocessing.Pipe()
+        # Il worker non è daemon: gli script eseguiti al suo interno possono creare pool di processi,
+        # come quando giravano con os.system
+        self._process = multiprocessing.Process(target=_worker_loop, args=(child_conn, self.modules, self.spacy_models,
+                                                                           self.nltk_corpora))
+        self._process.start()
+        self._ready = False
+        self._busy = False
+        child_conn.close()
+        _open_runners.add(self)
+        if not _atexit_registered:
+            # registrato dopo il primo avvio, così viene eseguito prima della chiusura di multiprocessing,
+            # che altrimenti aspetterebbe all'infinito un worker ancora in ascolto
+            atexit.register(_close_runners)
+            _atexit_registered = True
+
+    def start(self):
+        """ Avvia subito il worker, così il caricamento di librerie e modelli si sovrappone alle fasi iniziali """
+        if self.mode == 'worker' and (self._process is None or not self._process.is_alive()):
+            self._start_worker()
+
+    def _stop_worker(self):
+        # Ferma il worker nel mezzo di una fase; verrà riavviato alla prossima
+        self._process.terminate()
+        self._process.join(STOP_GRACE)
+        if self._process.is_alive():
+            os.kill(self._process.pid, signal.SIGKILL)
+            self._process.join()
+        self._process = None
+
+    def _run_in_worker(self, script, args, timeout=None):
+        if self._process is None or not self._process.is_alive():
+            self._start_worker()
+        sys.stdout.flush()
+        self._busy = True
+        try:
+            if not self._ready:
+                self.preload_time = self._conn.recv()
+                self._ready = True
+            self._conn.send((script, list(args), os.getcwd()))
+            if timeout is not None and not self._conn.poll(timeout):
+                self._stop_worker()
+                raise StageTimeout([script] + list(args), timeout)
+            result = self._conn.recv()
+            self._busy = False
+            return result
+        except (EOFError, OSError):
+            # Il worker è morto durante la fase: verrà riavviato alla prossima
+            self._process.join()
+            returncode = self._process.exitcode
+            self._process = None
+            self._busy = False
+            return returncode, {}
+
+    def _run_inline(self, script, args, timeout=None):
+        # Il limite di tempo usa SIGALRM, disponibile solo nel thread principale
+        if timeout is None or threading.current_thread() is not threading.main_thread():
+            return execute_measured(script, args)
+        previous = signal.signal(signal.SIGALRM, _expire)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            return execute_measured(script, args)
+        except _Expired:
+            raise StageTimeout([script] + list(args), timeout)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+    def run(self, command, timeout=None):
+        """
+        Esegue una fase e controlla il suo codice di uscita.
+
+        :param command: Lista con lo script Python o il binario seguito dai suoi argomenti.
+        :param timeout: Tempo massimo in secondi della fase, None per nessun limite.
+        :return: Dizionario con il tempo di CPU ('cpu', secondi), il picco di memoria ('maxrss', KB) e
+                 'maxrss_scope', 'stage' se il picco è della sola fase o 'process' se è del processo che l'ha eseguita.
+        :raises StageError: Se la fase termina con un codice diverso da zero.
+        :raises StageTimeout: Se la fase supera timeout e viene fermata.
+        """
+        command = [str(part) for part in command]
+        script, args = command[0], command[1:]
+        if not script.endswith('.py'):
+            returncode, usage = call_measured(command, timeout)
+        elif self.mode == 'worker':
+            returncode, usage = self._run_in_worker(script, args, timeout)
+        elif self.mode == 'inline':
+            returncode, usage = self._run_inline(script, args, timeout)
+        else:
+            returncode, usage = call_measured([sys.executable] + command, timeout)
+        if returncode != 0:
+            raise StageError(command, returncode)
+        return usage
+
+    def close(self):
+        """ Termina il worker persistente, se attivo; un worker interrotto nel mezzo di una fase viene fermato """
+        if self._process is not None and self._process.is_alive():
+            if self._busy:
+                self._stop_worker()
+            else:
+                self._conn.send(None)
+                self._process.join()
+        self._process = None
+        _open_runners.discard(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
@@ -0,0 +1,354 @@
+import os
+import sys
+import time
+import pickle
+import shutil
+import signal
+import argparse
+import tempfile
+import importlib.util
+from collections import OrderedDict
+import numpy as np
+import k8s_preprocess
+import vector_store
+from pipeline import mimick_command, MIMICK_PARAMS
+from stage_runner import StageRunner
+
+READ_SIZE = 65536
+# Vettori OOV calcolati da mimick durante lo stream conservati nella cache LRU
+OOV_CACHE_SIZE = 100000
+MIMICK_DIR = os.path.join('code', 'mimick')
+
+def follow(path, poll_interval=0.2, from_start=False, exit_at_eof=False):
+    """
+    Segue un file di log che cresce, come tail -F: restituisce le nuove righe complete (bytes, senza terminatore)
+    e None a ogni attesa senza dati, così che il chiamante possa chiudere un batch rimasto aperto.
+    Se il file viene ruotato o troncato viene riaperto dall'inizio.
+
+    :param path: File da seguire.
+    :param poll_interval: Attesa in secondi quando non ci sono nuovi dati.
+    :param from_start: Se True legge anche il contenuto già presente, altrimenti parte dalla fine.
+    :param exit_at_eof: Se True termina alla prima fine del file invece di attendere nuove righe.
+    """
+    file = None
+    buffer = b''
+    while True:
+        if file is None:
+            try:
+                file = open(path, 'rb')
+            except FileNotFoundError:
+                if exit_at_eof:
+                    return
+                yield None
+                time.sleep(poll_interval)
+                continue
+            if not from_start:
+                file.seek(0, os.SEEK_END)
+            # dopo una rotazione il nuovo file va letto dall'inizio
+            from_start = True
+        data = file.read(READ_SIZE)
+        if data:
+            lines = (buffer + data).split(b'\n')
+            buffer = lines.pop()
+            for line in lines:
+                yield line.rstrip(b'\r')
+            continue
+        if exit_at_eof:
+            if buffer:
+                yield buffer
+            file.close()
+            return
+        try:
+            stat = os.stat(path)
+            rotated = stat.st_ino != os.fstat(file.fileno()).st_ino or stat.st_size < file.tell()
+        except FileNotFoundError:
+            rotated = True
+        if rotated:
+            file.close()
+            file = None
+            buffer = b''
+        yield None
+        time.sleep(poll_interval)
+
+def build_oov_table(oov_words, vocab, output, runner, params=MIMICK_PARAMS, model_out=None):
+    """
+    Addestra mimick una sola volta, prima dello stream, e calcola i vettori di tutte le parole di vocab.
+
+    :param oov_words: Dataset di mimick (words.pkl) prodotto dalla pipeline.
+    :param vocab: File con le parole OOV attese, una per riga.
+    :param output: File di vettori in cui scrivere la tabella.
+    :param runner: StageRunner con cui eseguire mimick.
+    :param model_out: File in cui mimick salva i parametri del modello addestrato, per MimickModel.
+    :return: Percorso della tabella.
+    """
+    command = mimick_command(oov_words, vocab, output, params)
+    if model_out is not None:
+        command += ['--model-out', model_out]
+    runner.run(command)
+    vector_store.convert(output)
+    return output
+
+class LRUCache(object):
+    """ Cache limitata a capacity elementi: quando è piena viene scartato quello usato meno di recente """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = OrderedDict()
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key):
+        value = self.items.get(key)
+        if value is not None:
+            self.items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        if len(self.items) > self.capacity:
+            self.items.popitem(last=False)
+
+class MimickModel(object):
+    """
+    Modello di mimick addestrato da build_oov_table, caricato nel processo dello stream:
+    calcola i vettori delle parole assenti dalla tabella senza addestrare di nuovo il modello.
+
+    :param model_file: Parametri del modello salvati da mimick con --model-out.
+    :param oov_words: Dataset di mimick (words.pkl), da cui vengono letti i caratteri e la dimensione dei vettori.
+    :param params: Parametri di mimick usati per l'addestramento.
+    """
+
+    def __init__(self, model_file, oov_words, params=MIMICK_PARAMS, mimick_dir=MIMICK_DIR):
+        # model.py importa i moduli vicini (utils), necessari anche per leggere il dataset
+        mimick_dir = os.path.abspath(mimick_dir)
+        if mimick_dir not in sys.path:
+            sys.path.insert(0, mimick_dir)
+        spec = importlib.util.spec_from_file_location('mimick_model', os.path.join(mimick_dir, 'model.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        with open(oov_words, 'rb') as file:
+            dataset = pickle.load(file)
+        dimension = len(dataset['training_instances'][0].word_emb)
+        self.dynet = module.dy
+        self.model = module.LSTMMimick(dataset['c2i'], num_lstm_layers=params['num_of_layers'], char_dim=params['ch_dim'],
+                                       hidden_dim=params['hidden_dim'], word_embedding_dim=dimension, file=model_file)
+
+    def vectors(self, words):
+        """ Dizionario parola -> vettore calcolato dal modello """
+        result = {}
+        for word in words:
+            self.dynet.renew_cg()
+            result[word] = np.asarray(self.model.word_rep(word).npvalue(), dtype=np.float32)
+        return result
+
+class OOVTable(object):
+    """
+    Vettori delle parole OOV: quelli calcolati in anticipo da build_oov_table e, per le parole assenti
+    dalla tabella, quelli calcolati dal modello di mimick già addestrato, conservati in una cache LRU.
+    Durante lo stream mimick non viene mai addestrato: addestrarlo a ogni batch renderebbe la latenza
+    illimitata e darebbe a ogni batch vettori di un modello diverso, non confrontabili tra loro.
+    Senza modello le parole assenti dalla tabella vengono ignorate, come quelle senza vettore del modello delle parole.
+
+    :param path: File di vettori OOV in formato word2vec.
+    :param model: Oggetto MimickModel per le parole assenti dalla tabella, None per ignorarle.
+    :param capacity: Numero massimo di vettori calcolati dal modello conservati in cache.
+    """
+
+    def __init__(self, path, model=None, capacity=OOV_CACHE_SIZE):
+        self.store = vector_store.open_vectors(path)
+        self.model = model
+        self.cache = LRUCache(capacity)
+        self.requests = 0
+        self.table_hits = 0
+        self.cache_hits = 0
+
+    def vectors(self, words):
+        """ Dizionario parola -> vettore per le parole indicate presenti nella tabella o calcolate dal modello """
+        index, matrix = self.store.lookup(words)
+        result = dict((word, matrix[row]) for word, row in index.items())
+        self.requests += len(words)
+        self.table_hits += len(index)
+        missing = []
+        for word in words:
+            if word in result:
+                continue
+            vector = self.cache.get(word)
+            if vector is None:
+                missing.append(word)
+            else:
+                result[word] = vector
+                self.cache_hits += 1
+        if missing and self.model is not None:
+            for word, vector in self.model.vectors(missing).items():
+                self.cache.put(word, vector)
+                result[word] = vector
+        return result
+
+    @property
+    def hit_rate(self):
+        """ Frazione delle parole richieste trovate nella tabella o nella cache, senza eseguire il modello """
+        return (self.table_hits + self.cache_hits) / self.requests if self.requests else 0.0
+
+    @property
+    def cache_hit_rate(self):
+        """ Frazione delle parole assenti dalla tabella trovate nella cache """
+        lookups = self.requests - self.table_hits
+        return self.cache_hits / lookups if lookups else 0.0
+
+class StreamEmbedder(object):
+    """
+    Vettore di ogni messaggio come media dei vettori delle sue parole: quelle del vocabolario vengono
+    da embedding.model, le altre dalla tabella dei vettori OOV o dal modello di mimick.
+
+    :param word_model: Modello delle parole (embedding.model).
+    :param oov: Oggetto OOVTable per le parole fuori vocabolario, None per ignorarle.
+    """
+
+    def __init__(self, word_model, oov=None):
+        store = vector_store.open_vectors(word_model)
+        self.index = store.index
+        self.matrix = np.asarray(store.matrix)
+        self.oov = oov
+
+    def embed(self, messages):
+        tokens = [message.split() for message in messages]
+        unknown = set(word for words in tokens for word in words if word not in self.index)
+        oov_vectors = self.oov.vectors(unknown) if self.oov and unknown else {}
+        result = np.zeros((len(messages), self.matrix.shape[1]), dtype=np.float32)
+        for i, words in enumerate(tokens):
+            rows = [self.matrix[self.index[word]] if word in self.index else oov_vectors.get(word) for word in words]
+            rows = [row for row in rows if row is not None]
+            if rows:
+                result[i] = np.mean(rows, axis=0)
+        return result
+
+class BatchPreprocessor(object):
+    """ Rimuove le variabili dai messaggi di un batch con code/preprocessing.py, eseguito dallo StageRunner """
+
+    def __init__(self, runner, workdir):
+        self.runner = runner
+        self.input = os.path.join(workdir, 'stream_batch.log')
+        self.output = os.path.join(workdir, 'stream_batch.out')
+
+    def __call__(self, messages):
+        with open(self.input, 'w', encoding='utf-8') as file:
+            file.write(''.join(message + '\n' for message in messages))
+        self.runner.run(['code/preprocessing.py', '-rawlog', self.input, '-o', self.output])
+        with open(self.output, 'r', encoding='utf-8') as file:
+            return [line.rstrip('\n') for line in file]
+
+def stream(log_file, embedder, output, preprocess=None, batch_size=256, max_delay=1.0, report_interval=10.0,
+           from_start=False, exit_at_eof=False, strip_prefix=True):
+    """
+    Segue log_file e scrive in output un vettore per ogni nuovo messaggio, nel formato di log.vector.
+    Un batch viene elaborato quando raggiunge batch_size messaggi o quando il suo primo messaggio
+    attende da max_delay secondi, così la latenza resta limitata anche con poco traffico.
+
+    :return: Dizionario con le statistiche finali.
+    """
+    stats = {'lines': 0, 'batches': 0, 'latency': 0.0, 'max_latency': 0.0}
+    started = last_report = time.time()
+    batch = []
+    first_arrival = None
+    pending = []
+    reported = 0
+
+    def flush():
+        messages = preprocess(batch) if preprocess else batch
+        vectors = embedder.embed(messages)
+        output.write(''.join(' '.join('%f' % value for value in vector) + '\n' for vector in vectors))
+        output.flush()
+        latency = time.time() - first_arrival
+        stats['lines'] += len(batch)
+        stats['batches'] += 1
+        stats['latency'] += latency
+        stats['max_latency'] = max(stats['max_latency'], latency)
+
+    lines = follow(log_file, from_start=from_start, exit_at_eof=exit_at_eof)
+    try:
+        for line in lines:
+            if line is not None:
+                line = line.decode('utf-8', 'replace')
+                message, partial = k8s_preprocess.parse_line(line) if strip_prefix else (line, False)
+                pending.append(message)
+                if not partial:
+                    batch.append(''.join(pending))
+                    pending = []
+                    if first_arrival is None:
+                        first_arrival = time.time()
+            now = time.time()
+            if batch and (len(batch) >= batch_size or now - first_arrival >= max_delay):
+                flush()
+                batch = []
+                first_arrival = None
+            if now - last_report >= report_interval and stats['lines'] != reported:
+                report(stats, now - started, embedder)
+                last_report = now
+                reported = stats['lines']
+    except KeyboardInterrupt:
+        pass
+    if batch:
+        flush()
+    report(stats, time.time() - started, embedder)
+    return stats
+
+def report(stats, elapsed, embedder):
+    """ Stampa su stderr righe al secondo, latenza dei batch e hit rate della tabella e della cache OOV """
+    mean_latency = stats['latency'] / stats['batches'] if stats['batches'] else 0.0
+    line = 'lines: %d, %.1f lines/s, batch latency: mean %.0f ms, max %.0f ms' % (
+        stats['lines'], stats['lines'] / elapsed if elapsed > 0 else 0.0, mean_latency * 1000, stats['max_latency'] * 1000)
+    if embedder.oov:
+        oov = embedder.oov
+        line += ', OOV hit rate: %.1f%% (cache %.1f%%, %d/%d cached)' % (
+            oov.hit_rate * 100, oov.cache_hit_rate * 100, len(oov.cache), oov.cache.capacity)
+    print(line, file=sys.stderr, flush=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calcola in continuo i vettori delle nuove righe di un log CRI.')
+    parser.add_argument('-i', help='CRI log file to follow', required=True)
+    parser.add_argument('-word_model', help='trained word model (embedding.model)', required=True)
+    parser.add_argument('-oov_vectors', help='precomputed OOV vectors in word2vec format; OOV words are ignored if not given', default=None)
+    parser.add_argument('-oov_dataset', help='mimick dataset (words.pkl): train mimick once at startup and embed the words '
+                                             'missing from the table with the trained model', default=None)
+    parser.add_argument('-oov_vocab', help='expected OOV words, one per line, embedded at startup with -oov_dataset', default=None)
+    parser.add_argument('--oov-cache-size', help='maximum OOV vectors computed during the stream kept in the LRU cache',
+                        type=int, default=OOV_CACHE_SIZE)
+    parser.add_argument('-o', help='output file for the vectors, stdout if not given', default=None)
+    parser.add_argument('--batch-size', help='maximum messages per batch', type=int, default=256)
+    parser.add_argument('--max-delay', help='maximum seconds a message waits for its batch', type=float, default=1.0)
+    parser.add_argument('--report-interval', help='seconds between throughput reports', type=float, default=10.0)
+    parser.add_argument('--from-start', help='also embed the lines already in the file', action='store_true')
+    parser.add_argument('--exit-at-eof', help='stop at the end of the file instead of waiting for new lines', action='store_true')
+    parser.add_argument('--keep-prefix', help='do not strip CRI and klog prefixes', action='store_true')
+    parser.add_argument('--no-preprocess', help='do not run code/preprocessing.py on each batch', action='store_true')
+    parser.add_argument('--runner', help='how python stages are run', choices=['worker', 'inline', 'subprocess'], default='worker')
+    args = parser.parse_args()
+    if bool(args.oov_dataset) != bool(args.oov_vocab):
+        parser.error('-oov_dataset and -oov_vocab must be given together')
+
+    workdir = tempfile.mkdtemp(prefix='stream_embed_')
+    runner = StageRunner(args.runner)
+    oov_vectors = args.oov_vectors
+    model = None
+    if args.oov_dataset:
+        # mimick viene addestrato una sola volta; con -oov_vectors la tabella viene salvata per i prossimi avvii
+        model_file = os.path.join(workdir, 'stream_mimick.model')
+        oov_vectors = build_oov_table(args.oov_dataset, args.oov_vocab,
+                                      oov_vectors or os.path.join(workdir, 'stream_oov.vector'), runner, model_out=model_file)
+        model = MimickModel(model_file, args.oov_dataset)
+    oov = OOVTable(oov_vectors, model, args.oov_cache_size) if oov_vectors else None
+    embedder = StreamEmbedder(args.word_model, oov)
+    preprocess = None if args.no_preprocess else BatchPreprocessor(runner, workdir)
+    output = open(args.o, 'a', encoding='utf-8') if args.o else sys.stdout
+    # docker stop invia SIGTERM: il batch in corso viene completato come con Ctrl-C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        stream(args.i, embedder, output, preprocess, args.batch_size, args.max_delay, args.report_interval,
+               args.from_start, args.exit_at_eof, not args.keep_prefix)
+    finally:
+        runner.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+        if output is not sys.stdout:
+            output.close()
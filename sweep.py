@@ -0,0 +1,299 @@
+import os
+import math
+import json
+import time
+import random
+import argparse
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import pipeline
+import results_store
+from pipeline import LRCWE_PARAMS, MIMICK_PARAMS, profiler
+from stage_cache import StageCache
+from stage_runner import StageRunner
+
+# Fasi i cui parametri possono essere esplorati dallo sweep
+SPACE_STAGES = {'lrcwe': LRCWE_PARAMS, 'mimick': MIMICK_PARAMS}
+
+def load_space(path):
+    """
+    Legge lo spazio di ricerca da un file JSON, ad esempio
+    {"lrcwe": {"size": [32, 64], "window": [2, 3]}, "mimick": {"learning_rate": {"low": 0.001, "high": 0.01, "log": true}}}.
+    Una lista indica i valori possibili, un dizionario con low e high un intervallo (solo ricerca casuale,
+    con "int": true per valori interi e "log": true per una scala logaritmica), un valore singolo un parametro fisso.
+
+    :return: Dizionario fase -> parametro -> dominio.
+    """
+    with open(path) as file:
+        space = json.load(file)
+    for stage, params in space.items():
+        if stage not in SPACE_STAGES:
+            raise ValueError('Fase %s sconosciuta, fasi disponibili: %s' % (stage, ', '.join(SPACE_STAGES)))
+        unknown = set(params) - set(SPACE_STAGES[stage])
+        if unknown:
+            raise ValueError('Parametri sconosciuti per %s: %s' % (stage, ', '.join(sorted(unknown))))
+    return space
+
+def _domain(value):
+    # Valori discreti di un dominio, None se è un intervallo
+    if isinstance(value, dict):
+        return None
+    return value if isinstance(value, list) else [value]
+
+def _sample(value, rng):
+    values = _domain(value)
+    if values is not None:
+        return values[rng.randrange(len(values))]
+    low, high = value['low'], value['high']
+    if value.get('log'):
+        sample = math.exp(rng.uniform(math.log(low), math.log(high)))
+    else:
+        sample = rng.uniform(low, high)
+    return int(round(sample)) if value.get('int') else sample
+
+def _configuration(values):
+    # Parametri completi delle fasi: quelli di default sovrascritti da quelli della prova
+    return dict((stage, dict(defaults, **values.get(stage, {}))) for stage, defaults in SPACE_STAGES.items())
+
+def grid_configurations(space):
+    """ Tutte le combinazioni dei valori dello spazio di ricerca """
+    names = [(stage, name) for stage in sorted(space) for name in sorted(space[stage])]
+    domains = [_domain(space[stage][name]) for stage, name in names]
+    if any(domain is None for domain in domains):
+        raise ValueError('La ricerca a griglia richiede liste di valori, non intervalli')
+    configurations = []
+    for combination in itertools.product(*domains):
+        values = {}
+        for (stage, name), value in zip(names, combination):
+            values.setdefault(stage, {})[name] = value
+        configurations.append(_configuration(values))
+    return configurations
+
+def random_configurations(space, trials, seed=None):
+    """ trials combinazioni distinte estratte a caso dallo spazio di ricerca """
+    rng = random.Random(seed)
+    configurations = []
+    seen = set()
+    for _ in range(trials * 100):
+        if len(configurations) == trials:
+            break
+        values = dict((stage, dict((name, _sample(value, rng)) for name, value in sorted(params.items())))
+                      for stage, params in sorted(space.items()))
+        configuration = _configuration(values)
+        key = json.dumps(configuration, sort_keys=True)
+        if key not in seen:
+            seen.add(key)
+            configurations.append(configuration)
+    return configurations
+
+class Trial(object):
+    """
+    Una configurazione dello sweep con i punteggi delle sue ripetizioni.
+
+    :param number: Numero della prova, da 1.
+    :param params: Dizionario fase -> parametri.
+    :param workspace: Directory della prova.
+    """
+
+    def __init__(self, number, params, workspace):
+        self.number = number
+        self.params = params
+        self.workspace = workspace
+        self.scores = {}
+        self.status = 'pending'
+        self.train_model = None
+        self.oov_words = None
+        self.run_id = None
+
+    @property
+    def mean(self):
+        return float(np.mean(list(self.scores.values()))) if self.scores else None
+
+    @property
+    def sem(self):
+        # Errore standard della media dei punteggi
+        if len(self.scores) < 2:
+            return 0.0
+        return float(np.std(list(self.scores.values()), ddof=1) / math.sqrt(len(self.scores)))
+
+    def to_dict(self):
+        return {'trial': self.number, 'status': self.status, 'params': self.params, 'mean': self.mean,
+                'sem': self.sem, 'scores': dict((str(repetition), score) for repetition, score in sorted(self.scores.items()))}
+
+def is_clearly_worse(trial, best, min_repetitions, margin=0.0):
+    """
+    Una prova è chiaramente peggiore della migliore se, dopo almeno min_repetitions ripetizioni,
+    la sua media più due errori standard e il margine resta sotto la media della migliore.
+    """
+    if best is None or best is trial or len(trial.scores) < min_repetitions:
+        return False
+    return trial.mean + 2 * trial.sem + margin < best.mean
+
+# Runner e cache dei processi del pool, riusati da tutti i task eseguiti dallo stesso processo
+_pool_runner = None
+
+def _start_task():
+    global _pool_runner
+    if _pool_runner is None:
+        _pool_runner = StageRunner('inline')
+    profiler.events = []
+    return _pool_runner
+
+def train_task(processed_log, workspace, cache, lrcwe_params):
+    # Addestra il modello delle parole e il dataset di mimick di una prova; le fasi a monte vengono dalla cache
+    runner = _start_task()
+    cache.stats = {}
+    if not os.path.exists(workspace):
+        os.makedirs(workspace)
+    with profiler.stage('sweep_train'):
+        train_model, oov_words = pipeline.train(processed_log, workspace, cache, runner, False, lrcwe_params, False)
+    return (train_model, oov_words), cache.stats, profiler.events
+
+def repetition_task(repetition, train_model, oov_words, variant, workspace, cache, mimick_params, store, run_id):
+    # Una ripetizione di una prova: mimick sulla variante OOV condivisa da tutte le prove e valutazione
+    runner = _start_task()
+    cache.stats = {}
+    if not os.path.exists(workspace):
+        os.makedirs(workspace)
+    new_vocab, old_to_new_dict = variant
+    profiler.iteration = repetition
+    with profiler.stage('iteration'):
+        score = pipeline.run_iteration(train_model, oov_words, new_vocab, old_to_new_dict, workspace, cache, runner,
+                                       store, run_id, repetition, mimick_params)
+    profiler.iteration = None
+    return score, cache.stats, profiler.events
+
+def save_trials(trials, path):
+    """ Salva lo stato di tutte le prove, ordinate dalla migliore """
+    ranked = sorted(trials, key=lambda trial: -trial.mean if trial.mean is not None else math.inf)
+    with open(path + '.tmp', 'w') as file:
+        json.dump([trial.to_dict() for trial in ranked], file, indent=1)
+    os.replace(path + '.tmp', path)
+
+def best_trial(trials, min_repetitions):
+    # Le prove fermate non fanno da riferimento, così la migliore tra quelle ancora attive arriva sempre in fondo
+    candidates = [trial for trial in trials if trial.status not in ('failed', 'stopped') and len(trial.scores) >= min_repetitions]
+    return max(candidates, key=lambda trial: trial.mean) if candidates else None
+
+def sweep(trials, processed_log, variants, cache, jobs, store, log_type, run_name, min_repetitions=2, margin=0.0,
+          trials_file=None):
+    """
+    Esegue le prove su un pool di processi. Ogni prova è divisa in un task di training e un task per ripetizione;
+    i task vengono scelti per ripetizione crescente, così tutte le prove ricevono le prime ripetizioni
+    prima che le ripetizioni successive di una prova chiaramente peggiore della migliore vengano eseguite.
+
+    :param trials: Lista di Trial.
+    :param processed_log: Log preprocessato su cui addestrare tutte le prove.
+    :param variants: Varianti OOV (vocabolario, dizionario), una per ripetizione, uguali per tutte le prove.
+    :param jobs: Numero di processi.
+    :param min_repetitions: Ripetizioni dopo cui una prova può essere fermata.
+    :param margin: Differenza di punteggio oltre l'incertezza per fermare una prova.
+    :return: La prova migliore.
+    """
+    ready = [(0, trial.number, trial) for trial in trials]
+    running = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        while ready or running:
+            ready.sort(key=lambda task: task[:2])
+            while ready and len(running) < jobs:
+                repetition, _, trial = ready.pop(0)
+                if trial.status in ('stopped', 'failed'):
+                    continue
+                trial.status = 'running'
+                if repetition == 0:
+                    future = executor.submit(train_task, processed_log, trial.workspace, cache, trial.params['lrcwe'])
+                else:
+                    future = executor.submit(repetition_task, repetition, trial.train_model, trial.oov_words,
+                                             variants[repetition - 1],
+                                             os.path.join(trial.workspace, f'repetition_{repetition}'),
+                                             cache, trial.params['mimick'], store, trial.run_id)
+                running[future] = (repetition, trial)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                repetition, trial = running.pop(future)
+                try:
+                    result, stats, events = future.result()
+                except Exception as e:
+                    print(f'Trial {trial.number} failed: {e}', flush=True)
+                    trial.status = 'failed'
+                    continue
+                cache.merge(stats)
+                profiler.merge(events)
+                if repetition == 0:
+                    trial.train_model, trial.oov_words = result
+                    trial.run_id = store.add_run(log_type, f'{run_name}_sweep_trial{trial.number}', None, trial.params)
+                    ready.extend((r + 1, trial.number, trial) for r in range(len(variants)))
+                    continue
+                trial.scores[repetition] = result
+                if len(trial.scores) == len(variants):
+                    trial.status = 'complete'
+                print(f'Trial {trial.number} repetition {repetition}: {result} (mean {trial.mean:.6f})', flush=True)
+                best = best_trial(trials, min_repetitions)
+                for other in trials:
+                    if other.status in ('pending', 'running') and is_clearly_worse(other, best, min_repetitions, margin):
+                        other.status = 'stopped'
+                        print(f'Trial {other.number} stopped after {len(other.scores)} repetitions: '
+                              f'mean {other.mean:.6f}, best {best.mean:.6f} (trial {best.number})', flush=True)
+            if trials_file:
+                save_trials(trials, trials_file)
+    return best_trial(trials, 1)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Hyperparameter sweep of the lrcwe and mimick stages.')
+    parser.add_argument('-i', help='input_file', required=True)
+    parser.add_argument('-o', help='output directory', type=str, default='oov_result')
+    parser.add_argument('-t', help='log type', required=True)
+    parser.add_argument('-space', help='JSON search space, see load_space()', required=True)
+    parser.add_argument('--mode', help='grid or random search', choices=['grid', 'random'], default='grid')
+    parser.add_argument('--trials', help='number of configurations of the random search', type=int, default=10)
+    parser.add_argument('-n', help='repetitions (OOV variants) per trial', type=int, default=5)
+    parser.add_argument('--min-repetitions', help='repetitions before a trial can be stopped early', type=int, default=2)
+    parser.add_argument('--margin', help='score gap, beyond two standard errors, to stop a trial', type=float, default=0.0)
+    parser.add_argument('--jobs', help='number of parallel processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', help='seed of the OOV generation and of the random search', type=int, default=None)
+    parser.add_argument('--keep-prefix', help='do not strip CRI and klog prefixes before preprocessing', action='store_true')
+    parser.add_argument('--db', help='SQLite results store, <output>/<log type>/results.db by default', type=str, default=None)
+    parser.add_argument('--runner', help='how python stages of the preprocessing are run', choices=['worker', 'inline', 'subprocess'], default='worker')
+    args = parser.parse_args()
+
+    started = time.time()
+    output_path = os.path.abspath(args.o)
+    opath = os.path.join(output_path, args.t)
+    sweep_dir = os.path.join(opath, 'sweep')
+    os.makedirs(sweep_dir, exist_ok=True)
+    space = load_space(args.space)
+    seed = args.seed if args.seed is not None else np.random.SeedSequence().entropy
+    if args.mode == 'grid':
+        configurations = grid_configurations(space)
+    else:
+        configurations = random_configurations(space, args.trials, seed)
+    trials = [Trial(number + 1, params, os.path.join(sweep_dir, f'trial_{number + 1}'))
+              for number, params in enumerate(configurations)]
+    print(f'{len(trials)} trials, {args.n} repetitions each, OOV seed: {seed}', flush=True)
+
+    # Preprocessing e varianti OOV sono comuni a tutte le prove
+    runner = StageRunner(args.runner)
+    jobs = max(1, min(args.jobs, os.cpu_count() or 1))
+    processed_log = pipeline.preprocess_log(os.path.abspath(args.i), opath, runner, jobs, not args.keep_prefix)
+    runner.close()
+    variant_dirs = [os.path.join(sweep_dir, 'variants', f'repetition_{i + 1}') for i in range(args.n)]
+    with profiler.stage('generate_oov', [processed_log]):
+        variants = pipeline.generate_oov_variants(processed_log, variant_dirs,
+                                                  [pipeline.oov_seed(seed, i) for i in range(args.n)])
+
+    cache = StageCache(os.path.join(output_path, '.stage_cache'))
+    store = results_store.ResultsStore(args.db or os.path.join(opath, 'results.db'))
+    trials_file = os.path.join(sweep_dir, 'trials.json')
+    best = sweep(trials, processed_log, variants, cache, jobs, store, results_store.log_type(args.t), args.t,
+                 args.min_repetitions, args.margin, trials_file)
+    store.close()
+
+    stopped = sum(trial.status == 'stopped' for trial in trials)
+    print(f'Sweep finished in {time.time() - started:.0f} s, {stopped} trials stopped early, results in {trials_file}', flush=True)
+    if best is not None:
+        print(f'Best trial {best.number}: mean {best.mean:.6f} over {len(best.scores)} repetitions', flush=True)
+        print(json.dumps(best.params, indent=1, sort_keys=True), flush=True)
+    print(cache.report(), flush=True)
+    profiler.save(os.path.join(sweep_dir, 'profile.json'), os.path.join(sweep_dir, 'profile.trace.json'))
+    print(profiler.summary(), flush=True)
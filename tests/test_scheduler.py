@@ -0,0 +1,73 @@
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from scheduler import Job, LocalRunner, run_jobs
+
+# Job di prova: registra inizio e fine in <dir>/<run_name>.<attempt> e termina con il codice richiesto
+JOB_SCRIPT = """
+import sys, time
+directory, run_name, attempt, seconds, fail_until = sys.argv[1:]
+path = '%s/%s.%s' % (directory, run_name, attempt)
+with open(path, 'w') as file:
+    file.write('%f\\n' % time.time())
+time.sleep(float(seconds))
+with open(path, 'a') as file:
+    file.write('%f\\n' % time.time())
+sys.exit(1 if int(attempt) < int(fail_until) else 0)
+"""
+
+def make_runner(directory, seconds=0.0, fail_until=0):
+    """ LocalRunner che esegue JOB_SCRIPT; i tentativi prima di fail_until falliscono """
+    return LocalRunner([sys.executable, '-c', JOB_SCRIPT, str(directory), '{run_name}', '{attempt}',
+                        str(seconds), str(fail_until)])
+
+def make_jobs(count):
+    return [Job('test.log', 'test_%d' % (i + 1)) for i in range(count)]
+
+def read_intervals(directory):
+    intervals = []
+    for name in os.listdir(directory):
+        with open(os.path.join(directory, name)) as file:
+            times = [float(line) for line in file if line.strip()]
+        intervals.append((times[0], times[-1]))
+    return intervals
+
+def max_overlap(intervals):
+    events = sorted([(start, 1) for start, _ in intervals] + [(end, -1) for _, end in intervals], key=lambda e: (e[0], e[1]))
+    running = peak = 0
+    for _, change in events:
+        running += change
+        peak = max(peak, running)
+    return peak
+
+def test_slots_limit_concurrent_jobs(tmp_path):
+    results = run_jobs(make_jobs(6), make_runner(tmp_path, seconds=0.5), slots=2)
+    assert [result.status for result in results] == ['ok'] * 6
+    assert max_overlap(read_intervals(tmp_path)) == 2
+
+def test_failed_job_is_retried_until_it_succeeds(tmp_path):
+    results = run_jobs(make_jobs(3), make_runner(tmp_path, fail_until=2), slots=2, retries=2)
+    assert sorted(result.job.run_name for result in results) == ['test_1', 'test_2', 'test_3']
+    assert all(result.status == 'ok' and result.returncode == 0 for result in results)
+    assert all(result.job.attempt == 2 for result in results)
+    assert len(os.listdir(tmp_path)) == 9
+
+def test_retries_are_limited(tmp_path):
+    reported = []
+    results = run_jobs(make_jobs(2), make_runner(tmp_path, fail_until=10), slots=2, retries=1, on_result=reported.append)
+    assert [result.status for result in results] == ['failed', 'failed']
+    assert all(result.returncode == 1 and result.job.attempt == 1 for result in results)
+    assert sorted(os.listdir(tmp_path)) == ['test_1.0', 'test_1.1', 'test_2.0', 'test_2.1']
+    assert reported == results
+
+def test_timeout_stops_the_job(tmp_path):
+    started = time.time()
+    results = run_jobs(make_jobs(2), make_runner(tmp_path, seconds=30), slots=2, timeout=0.5, retries=1)
+    assert time.time() - started < 20
+    assert [result.status for result in results] == ['timeout', 'timeout']
+    assert all(result.returncode != 0 and result.job.attempt == 1 for result in results)
+    # i job fermati non arrivano a scrivere la fine
+    assert all(start == end for start, end in read_intervals(tmp_path))
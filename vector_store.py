@@ -0,0 +1,147 @@
+import os
+import argparse
+import numpy as np
+
+# Righe di testo convertite per ogni blocco
+CONVERT_BATCH_SIZE = 100000
+
+def store_paths(path):
+    """ File binari associati a un file di vettori: matrice float32 .npy e chiavi, una per riga """
+    return path + '.npy', path + '.keys'
+
+def is_fresh(path):
+    """ True se esiste una versione binaria di path non più vecchia del file di testo """
+    matrix_path, _ = store_paths(path)
+    if not os.path.isfile(matrix_path):
+        return False
+    return not os.path.isfile(path) or os.stat(matrix_path).st_mtime_ns >= os.stat(path).st_mtime_ns
+
+def _read_header(path):
+    # Restituisce (righe, dimensione, header presente) leggendo al più due righe
+    with open(path, 'r', encoding='utf-8', errors='replace') as file:
+        first = file.readline().split()
+        if len(first) == 2 and all(part.isdigit() for part in first):
+            return int(first[0]), int(first[1]), True
+        rows = 1 + sum(1 for line in file if line.strip()) if first else 0
+    return rows, len(first), False
+
+def convert(path):
+    """
+    Converte un file di vettori testuale nel formato binario.
+    Sono accettati sia il formato word2vec (header "righe dimensione" e una parola all'inizio di ogni riga),
+    usato per embedding.model e oov.vector, sia righe di soli valori come in log.vector:
+    in questo caso non viene scritto il file delle chiavi e la chiave di ogni vettore è il numero di riga.
+
+    :param path: File di vettori testuale.
+    :return: Percorso del file .npy scritto.
+    """
+    matrix_path, keys_path = store_paths(path)
+    rows, dimension, header = _read_header(path)
+    suffix = '.tmp%d' % os.getpid()
+    matrix = np.lib.format.open_memmap(matrix_path + suffix, mode='w+', dtype=np.float32, shape=(rows, dimension))
+    keys = open(keys_path + suffix, 'w', encoding='utf-8') if header else None
+    count = 0
+    with open(path, 'r', encoding='utf-8', errors='replace') as file:
+        if header:
+            file.readline()
+        while count < rows:
+            lines = [line for line in (file.readline() for _ in range(CONVERT_BATCH_SIZE)) if line.strip()]
+            if not lines:
+                break
+            if header:
+                parts = [line.rstrip().partition(' ') for line in lines]
+                keys.write(''.join(word + '\n' for word, _, _ in parts))
+                values = ' '.join(values for _, _, values in parts)
+            else:
+                values = ' '.join(lines)
+            block = np.fromstring(values, dtype=np.float32, sep=' ').reshape(len(lines), dimension)
+            matrix[count:count + len(lines)] = block
+            count += len(lines)
+    if count != rows:
+        raise ValueError('%s has %d vectors, header says %d' % (path, count, rows))
+    matrix.flush()
+    del matrix
+    if keys:
+        keys.close()
+        os.rename(keys_path + suffix, keys_path)
+    elif os.path.isfile(keys_path):
+        os.remove(keys_path)
+    # la matrice viene rinominata per ultima: la sua presenza indica una conversione completa
+    os.rename(matrix_path + suffix, matrix_path)
+    return matrix_path
+
+class VectorStore(object):
+    """
+    Vettori in formato binario: la matrice viene aperta in memory map, quindi il caricamento è immediato
+    e le pagine lette sono condivise tramite la page cache tra tutti i processi che aprono lo stesso file.
+
+    :param path: File di vettori testuale; la versione binaria viene creata o aggiornata se necessario.
+    """
+
+    def __init__(self, path):
+        if not is_fresh(path):
+            convert(path)
+        matrix_path, keys_path = store_paths(path)
+        self.path = path
+        self.matrix = np.load(matrix_path, mmap_mode='r')
+        self.keys = None
+        if os.path.isfile(keys_path):
+            with open(keys_path, 'r', encoding='utf-8') as file:
+                self.keys = file.read().split('\n')[:len(self.matrix)]
+        self._index = None
+
+    def __len__(self):
+        return len(self.matrix)
+
+    @property
+    def index(self):
+        """ Dizionario chiave -> riga, con la prima occorrenza di ogni chiave """
+        if self._index is None:
+            keys = self.keys if self.keys is not None else range(len(self.matrix))
+            self._index = {}
+            for row, key in enumerate(keys):
+                self._index.setdefault(key, row)
+        return self._index
+
+    def lookup(self, keys):
+        """
+        Estrae i vettori delle chiavi richieste presenti nello store.
+
+        :return: Tuple (dizionario chiave -> indice di riga, matrice float32 dei soli vettori richiesti).
+        """
+        found = {}
+        rows = []
+        for key in keys:
+            row = self.index.get(key)
+            if row is not None and key not in found:
+                found[key] = len(rows)
+                rows.append(row)
+        return found, np.asarray(self.matrix[np.array(rows, dtype=np.int64)], dtype=np.float32)
+
+    def export_text(self, output_path):
+        """ Riscrive i vettori in formato testuale, con header word2vec se lo store ha le chiavi """
+        with open(output_path, 'w', encoding='utf-8') as file:
+            if self.keys is not None:
+                file.write('%d %d\n' % self.matrix.shape)
+            for start in range(0, len(self.matrix), CONVERT_BATCH_SIZE):
+                block = self.matrix[start:start + CONVERT_BATCH_SIZE]
+                lines = [' '.join('%f' % value for value in row) for row in block]
+                if self.keys is not None:
+                    lines = [key + ' ' + line for key, line in zip(self.keys[start:start + CONVERT_BATCH_SIZE], lines)]
+                file.write(''.join(line + '\n' for line in lines))
+
+def open_vectors(path):
+    """ Apre i vettori di path nel formato binario, convertendo il file di testo se necessario """
+    return VectorStore(path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Converte file di vettori tra formato testuale e binario.')
+    parser.add_argument('vectors', nargs='+', help='vector files in text format')
+    parser.add_argument('--export', help='write the binary store of a single vector file back as text', default=None)
+    args = parser.parse_args()
+
+    if args.export:
+        open_vectors(args.vectors[0]).export_text(args.export)
+    else:
+        for path in args.vectors:
+            print(convert(path), flush=True)